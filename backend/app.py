@@ -1,13 +1,20 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
-import mysql.connector
 import os
-from utils.qrcode_util import generate_and_save_qrcodes
+import json
+from utils.qrcode_util import generate_qrcode_store, qrcode_key, qrcode_store_path, regenerate_qrcodes_chunked, save_qrcode_file, tree_exists
 from config import CONFIG
 from utils.image_processor import ImageProcessor  # 导入图像处理类
 from utils.detector import RubberTreeDetector  # 导入检测器类
 from utils.coordinate_processor import CoordinateProcessor  # 导入坐标处理类
 from utils.db_processor import DatabaseProcessor  # 导入数据库处理类
+from utils.job_manager import JobManager  # 导入后台任务管理类
+from utils.db_pool import close_streaming_cursor, get_connection, pool_stats  # 导入共享数据库连接池
+from utils.tree_clusters import TreeClusterIndex, load_tree_points  # 导入地图聚合索引
+from utils.run_manifest import open_run_manifest  # 导入运行清单
+from utils.label_sheet import iter_label_trees, stream_label_pdf, stream_label_zip  # 导入标签导出
+from utils.cog_ingest import UploadIngestor  # 导入上传文件 COG 转换
+from utils.xyz_tiles import XyzTileServer  # 导入正射影像瓦片服务
 from flask_jwt_extended import JWTManager, create_access_token
 
 app = Flask(__name__)
@@ -17,15 +24,9 @@ CORS(app)  # 允许跨域请求
 app.config['JWT_SECRET_KEY'] = 'your_secret_key'  # 更改为你的密钥
 jwt = JWTManager(app)
 
-# 数据库连接函数
+# 数据库连接函数：从共享连接池借出连接，close() 时归还
 def get_db_connection():
-    connection = mysql.connector.connect(
-        host=CONFIG['database']['host'],
-        user=CONFIG['database']['user'],
-        password=CONFIG['database']['password'],
-        database=CONFIG['database']['database']
-    )
-    return connection
+    return get_connection(CONFIG['database'], CONFIG['database_pool'])
 @app.route('/')
 def index():
     return jsonify({"message": "Welcome to the Rubber Tree System API!"})
@@ -41,18 +42,19 @@ def register():
 
     cursor = connection.cursor()
 
-    # 检查用户是否已存在
-    cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-    if cursor.fetchone():
-        print(f"用户 {username} 已存在")  # 添加调试信息
-        return jsonify({"msg": "用户已存在"}), 400
-
-    # 存储用户信息，明文密码
-    cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, password))
-    connection.commit()
-
-    cursor.close()
-    connection.close()
+    try:
+        # 检查用户是否已存在
+        cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+        if cursor.fetchone():
+            print(f"用户 {username} 已存在")  # 添加调试信息
+            return jsonify({"msg": "用户已存在"}), 400
+
+        # 存储用户信息，明文密码
+        cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, password))
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()  # 归还连接池
 
     print(f"用户 {username} 注册成功")  # 添加调试信息
     return jsonify({"msg": "注册成功"}), 201
@@ -68,8 +70,12 @@ def login():
 
     cursor = connection.cursor()
 
-    cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-    user = cursor.fetchone()
+    try:
+        cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+        user = cursor.fetchone()
+    finally:
+        cursor.close()
+        connection.close()  # 归还连接池
 
     if user:
         print(f"找到用户: {username}")  # 添加调试信息
@@ -93,13 +99,18 @@ def upload_dom_file():
     if file.filename == '':
         return jsonify({'error': '没有选择 DOM 文件'}), 400
 
-    # 获取当前文件的绝对路径
-    base_path = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件的目录
-    save_path = os.path.join(base_path, 'input', 'dom', file.filename)  # 保存到 backend/input/dom
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)  # 确保目录存在
-    file.save(save_path)
-
-    return jsonify({'message': 'DOM 文件上传成功！'}), 200
+    if not CONFIG['cog']['enabled']:
+        # 获取当前文件的绝对路径
+        base_path = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件的目录
+        save_path = os.path.join(base_path, 'input', 'dom', file.filename)  # 保存到 backend/input/dom
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)  # 确保目录存在
+        file.save(save_path)
+        return jsonify({'message': 'DOM 文件上传成功！'}), 200
+
+    # 暂存到 input/uploads/dom，后台转换为 COG 后写入 input/dom
+    file.save(upload_ingestor().upload_path('dom', file.filename))
+    job = job_manager.submit(['ingest_uploads'])
+    return jsonify({'message': 'DOM 文件上传成功，正在后台转换为 COG', 'job': job.to_dict()}), 202
 @app.route('/api/upload/dsm', methods=['POST'])
 def upload_dsm_file():
     """处理 DSM 文件上传"""
@@ -110,13 +121,18 @@ def upload_dsm_file():
     if file.filename == '':
         return jsonify({'error': '没有选择 DSM 文件'}), 400
 
-    # 获取当前文件的绝对路径
-    base_path = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件的目录
-    save_path = os.path.join(base_path, 'input', 'dsm', file.filename)  # 保存到 backend/input/dsm
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)  # 确保目录存在
-    file.save(save_path)
-
-    return jsonify({'message': 'DSM 文件上传成功！'}), 200
+    if not CONFIG['cog']['enabled']:
+        # 获取当前文件的绝对路径
+        base_path = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件的目录
+        save_path = os.path.join(base_path, 'input', 'dsm', file.filename)  # 保存到 backend/input/dsm
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)  # 确保目录存在
+        file.save(save_path)
+        return jsonify({'message': 'DSM 文件上传成功！'}), 200
+
+    # 暂存到 input/uploads/dsm，后台转换为 COG 后写入 input/dsm
+    file.save(upload_ingestor().upload_path('dsm', file.filename))
+    job = job_manager.submit(['ingest_uploads'])
+    return jsonify({'message': 'DSM 文件上传成功，正在后台转换为 COG', 'job': job.to_dict()}), 202
 # 获取文件夹的绝对路径
 def get_directory_path(folder_name):
     base_path = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件的目录
@@ -137,43 +153,145 @@ def get_dsm_count():
     """获取 DSM 分割数量"""
     try:
         dsm_tiles_path = get_directory_path('dsm_tiles')
-        count = len([name for name in os.listdir(dsm_tiles_path) if os.path.isfile(os.path.join(dsm_tiles_path, name))])  # 计算文件数量
+        count = len([name for name in os.listdir(dsm_tiles_path) if name.endswith(('.csv', '.npy'))])  # 计算切片数量，不含 .json 说明文件
     except Exception as e:
         print(f"读取 DSM 分割数量失败: {e}")
         return jsonify({'count': 0}), 500  # 如果读取失败，返回 0
 
     return jsonify({'count': count})
-@app.route('/api/process', methods=['POST'])
-def process_files():
-    """处理上传的 DOM 和 DSM 文件"""
-    try:
-        # 创建图像处理器实例
+def upload_ingestor(progress_callback=None):
+    """创建上传文件导入器"""
+    return UploadIngestor({
+        'input_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'input')),  # 输入目录
+        'cog': CONFIG['cog'],  # COG 转换配置
+        'progress_callback': progress_callback
+    })
+def run_ingest_step(progress_callback=None):
+    """流水线阶段：将上传的 DOM 和 DSM 转换为 COG（分块、压缩、带概览）"""
+    return upload_ingestor(progress_callback).ingest_pending()
+def run_process_step(progress_callback=None):
+    """流水线阶段：切割 DOM 和 DSM"""
+    # 先完成尚未转换的上传文件（正在后台转换时等待其完成），保证后续阶段读取的是 COG
+    run_ingest_step()
+    output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'output'))
+    with open_run_manifest(output_dir, CONFIG['manifest']) as manifest:
         config = {
             'input_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'input')),  # 输入目录
-            'output_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'output'))  # 输出目录
+            'output_dir': output_dir,  # 输出目录
+            'tiling': CONFIG['tiling'],  # 并行切片配置
+            'manifest': manifest,  # 运行清单，只切割变化或未完成的切片
+            'progress_callback': progress_callback
         }
         processor = ImageProcessor(config)
 
         # 执行处理
         processor.process_first_step()
-
-        return jsonify({'message': '文件处理完成，切割和CSV生成成功！'}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-@app.route('/api/detect', methods=['POST'])
-def detect_objects():
-    """对切割好的DOM图片进行检测"""
-    try:
+def run_detect_step(progress_callback=None):
+    """流水线阶段：对切割好的DOM图片进行检测"""
+    output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'output'))
+    with open_run_manifest(output_dir, CONFIG['manifest']) as manifest:
         # 使用 CONFIG 中的权重目录
         config = {
             'weights_dir': CONFIG['weights_dir'],  # 从配置中获取权重目录
-            'output_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'output'))  # 输出目录
+            'output_dir': output_dir,  # 输出目录
+            'detection': CONFIG['detection'],  # 批量推理配置
+            'manifest': manifest,  # 运行清单，跳过权重和切片都未变化的切片
+            'progress_callback': progress_callback
         }
         detector = RubberTreeDetector(config)
 
         # 执行检测
-        detector.detect_tiles()
+        if CONFIG['detection']['streaming'] or CONFIG['detection']['sliding_window']:
+            # 流式/滑窗模式：直接从输入DOM按窗口读取切片
+            processor = ImageProcessor({
+                'input_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'input')),
+                'output_dir': output_dir,
+                'tiling': CONFIG['tiling'],  # 镶嵌模式与切片名前缀需与切片阶段一致
+                'manifest': manifest
+            })
+            detector.detect_rasters(processor)
+        else:
+            detector.detect_tiles()
+def run_coordinates_step(progress_callback=None):
+    """流水线阶段：处理检测结果以提取坐标信息"""
+    output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'output'))
+    with open_run_manifest(output_dir, CONFIG['manifest']) as manifest:
+        # 创建坐标处理器实例
+        config = {
+            'input_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'input')),  # 输入目录，用于读取DSM坐标系
+            'output_dir': output_dir,  # 输出目录
+            'coordinates': CONFIG['coordinates'],  # 坐标转换配置
+            'manifest': manifest,  # 运行清单，跳过检测结果和DSM都未变化的切片
+            'progress_callback': progress_callback
+        }
+        coordinate_processor = CoordinateProcessor(config)
 
+        # 执行坐标处理
+        coordinate_processor.process_detection_results()  # 确保调用了处理检测结果的方法
+def run_save_coordinates_step(progress_callback=None):
+    """流水线阶段：将坐标结果保存到数据库"""
+    # 创建数据库处理器实例
+    config = {
+        'output_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'output')),  # 输出目录
+        'database': {
+            'host': CONFIG['database']['host'],
+            'user': CONFIG['database']['user'],
+            'password': CONFIG['database']['password'],
+            'database': CONFIG['database']['database']
+        },
+        'database_pool': CONFIG['database_pool'],  # 共享连接池配置
+        'ingest': CONFIG['ingest'],  # 批量导入配置
+        'progress_callback': progress_callback
+    }
+    db_processor = DatabaseProcessor(config)
+
+    # 创建数据表
+    db_processor.create_table()
+
+    # 保存坐标
+    db_processor.save_coordinates()
+
+    # 新数据导入后地图聚合缓存失效
+    tree_cluster_index.invalidate()
+
+def run_qrcode_step(progress_callback=None):
+    """流水线阶段：为缺少二维码的树木生成二维码"""
+    if CONFIG['qrcode']['storage'] == 'files':
+        # 二维码文件存储：已存在的跳过，缺失的并行生成
+        return generate_qrcode_store(progress_callback=progress_callback)
+    # 数据库存储：分块流式读取，并行生成，批量更新并定期提交
+    return regenerate_qrcodes_chunked(progress_callback=progress_callback)
+
+
+# 后台任务：各阶段可以组合为一个流水线任务提交
+PIPELINE_STAGES = {
+    'ingest_uploads': run_ingest_step,
+    'process': run_process_step,
+    'detect': run_detect_step,
+    'process_coordinates': run_coordinates_step,
+    'save_coordinates': run_save_coordinates_step,
+    'generate_qrcodes': run_qrcode_step
+}
+# 切割、检测、坐标提取、入库读写同一套 input/output 目录，包含这些阶段的任务依次执行
+EXCLUSIVE_STAGES = ('process', 'detect', 'process_coordinates', 'save_coordinates')
+job_manager = JobManager(PIPELINE_STAGES, max_workers=CONFIG['jobs']['max_workers'],
+                         max_finished_jobs=CONFIG['jobs']['max_finished_jobs'],
+                         exclusive_stages=EXCLUSIVE_STAGES)
+@app.route('/api/process', methods=['POST'])
+def process_files():
+    """处理上传的 DOM 和 DSM 文件"""
+    try:
+        with job_manager.pipeline_lock:
+            run_process_step()
+        return jsonify({'message': '文件处理完成，切割和CSV生成成功！'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+@app.route('/api/detect', methods=['POST'])
+def detect_objects():
+    """对切割好的DOM图片进行检测"""
+    try:
+        with job_manager.pipeline_lock:
+            run_detect_step()
         return jsonify({'message': '检测完成，结果已保存！'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -181,15 +299,8 @@ def detect_objects():
 def process_coordinates():
     """处理检测结果以提取坐标信息"""
     try:
-        # 创建坐标处理器实例
-        config = {
-            'output_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'output'))  # 输出目录
-        }
-        coordinate_processor = CoordinateProcessor(config)
-
-        # 执行坐标处理
-        coordinate_processor.process_detection_results()  # 确保调用了处理检测结果的方法
-
+        with job_manager.pipeline_lock:
+            run_coordinates_step()
         return jsonify({'message': '坐标处理完成，结果已保存！'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -197,27 +308,32 @@ def process_coordinates():
 def save_coordinates():
     """将坐标结果保存到数据库"""
     try:
-        # 创建数据库处理器实例
-        config = {
-            'output_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'output')),  # 输出目录
-            'database': {
-                'host': CONFIG['database']['host'],
-                'user': CONFIG['database']['user'],
-                'password': CONFIG['database']['password'],
-                'database': CONFIG['database']['database']
-            }
-        }
-        db_processor = DatabaseProcessor(config)
-
-        # 创建数据表
-        db_processor.create_table()
-
-        # 保存坐标
-        db_processor.save_coordinates()
-
+        with job_manager.pipeline_lock:
+            run_save_coordinates_step()
         return jsonify({'message': '坐标数据已成功保存到数据库！'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """提交后台流水线任务，默认依次执行处理、检测、坐标提取、入库四个阶段"""
+    data = request.get_json(silent=True) or {}
+    stages = data.get('stages', ['process', 'detect', 'process_coordinates', 'save_coordinates'])
+    try:
+        job = job_manager.submit(stages)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(job.to_dict()), 202
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """获取所有后台任务的状态"""
+    return jsonify([job.to_dict() for job in job_manager.list()])
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询后台任务的阶段、已完成切片数和吞吐"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job.to_dict()), 200
 @app.route('/api/coordinates', methods=['GET'])
 def get_coordinates():
     """获取所有坐标信息"""
@@ -231,6 +347,143 @@ def get_coordinates():
     connection.close()
 
     return jsonify(coordinates)
+@app.route('/api/db_pool/stats', methods=['GET'])
+def get_db_pool_stats():
+    """获取数据库连接池饱和度指标"""
+    return jsonify(pool_stats())
+@app.route('/api/trees', methods=['GET'])
+def get_trees_in_bbox():
+    """按经纬度范围查询树木（使用 location 空间索引），bbox=minlon,minlat,maxlon,maxlat"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = map(float, request.args.get('bbox', '').split(','))
+    except ValueError:
+        return jsonify({"error": "bbox 参数格式应为 minlon,minlat,maxlon,maxlat"}), 400
+    if min_lon > max_lon or min_lat > max_lat:
+        return jsonify({"error": "bbox 范围无效"}), 400
+    limit = min(request.args.get('limit', CONFIG['tree_query']['default_limit'], type=int),
+                CONFIG['tree_query']['max_limit'])
+
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id, tree_id, longitude, latitude, elevation, image_name
+            FROM tree_data
+            WHERE MBRContains(ST_MakeEnvelope(POINT(%s, %s), POINT(%s, %s)), location)
+            LIMIT %s
+        """, (min_lon, min_lat, max_lon, max_lat, limit))
+        trees = cursor.fetchall()
+        return jsonify({"trees": trees, "count": len(trees), "truncated": len(trees) >= limit}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+# 列表接口允许返回的字段，默认不包含 qrcode 等大字段
+TREE_LIST_FIELDS = (
+    'id', 'tree_id', 'longitude', 'latitude', 'elevation', 'image_name', 'created_at',
+    'yield', 'tree_height', 'branch_height', 'crown_diameter', 'cross_section_area',
+    'crown_area', 'crown_volume', 'biomass', 'qrcode'
+)
+TREE_LIST_DEFAULT_FIELDS = ('id', 'tree_id', 'longitude', 'latitude', 'elevation', 'image_name', 'created_at')
+@app.route('/api/trees/list', methods=['GET'])
+def list_trees():
+    """
+    流式返回树木列表（NDJSON，每行一条记录）
+    按 id 键集分页：after_id 为上一页最后一条记录的 id，limit 为本页条数（不传则返回之后的全部记录）
+    fields 为逗号分隔的字段列表，默认不返回 qrcode
+    """
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(TREE_LIST_DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in TREE_LIST_FIELDS]
+    if unknown:
+        return jsonify({"error": f"不支持的字段: {', '.join(unknown)}"}), 400
+    if 'id' not in fields:
+        fields.insert(0, 'id')  # 客户端需要 id 才能请求下一页
+
+    query = f"SELECT {', '.join(f'`{f}`' for f in fields)} FROM tree_data WHERE id > %s ORDER BY id"
+    params = [after_id]
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(max(0, limit))
+
+    batch_size = CONFIG['tree_query']['stream_batch_size']
+
+    def generate():
+        connection = get_db_connection()
+        # 非缓冲游标：结果在服务器端逐批读取，内存占用与表大小无关
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(row, default=str, ensure_ascii=False) + '\n' for row in rows)
+        finally:
+            # 客户端中途断开时结果集可能未读完，先丢弃剩余结果再归还连接
+            close_streaming_cursor(cursor, connection, batch_size)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+# 地图聚合索引：每个缩放级别首次请求时计算并缓存
+tree_cluster_index = TreeClusterIndex(
+    lambda: load_tree_points(get_db_connection),
+    cells_per_tile=CONFIG['tree_query']['cluster_cells_per_tile']
+)
+@app.route('/api/trees/clusters', methods=['GET'])
+def get_tree_clusters():
+    """获取 Web Mercator 瓦片 z/x/y 内的树木聚合结果（每个网格单元的数量和中心点）"""
+    z = request.args.get('z', type=int)
+    x = request.args.get('x', type=int)
+    y = request.args.get('y', type=int)
+    if z is None or x is None or y is None:
+        return jsonify({"error": "缺少参数 z、x、y"}), 400
+
+    try:
+        clusters = tree_cluster_index.clusters(z, x, y)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "z": z, "x": x, "y": y,
+        "clusters": clusters,
+        "total": sum(cluster['count'] for cluster in clusters)
+    }), 200
+# 正射影像瓦片服务：进程内 LRU 缓存 + 磁盘缓存（output/xyz_tiles）
+xyz_tile_server = XyzTileServer({
+    'input_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'input')),
+    'output_dir': os.path.abspath(os.path.join(os.path.dirname(__file__), 'output')),
+    'xyz_tiles': CONFIG['xyz_tiles']
+})
+@app.route('/api/tiles', methods=['GET'])
+def list_tile_runs():
+    """列出可用的正射影像瓦片数据源（运行名称、经纬度范围、缩放级别范围）"""
+    try:
+        return jsonify(xyz_tile_server.list_runs()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+@app.route('/api/tiles/<run>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_dom_tile(run, z, x, y):
+    """获取DOM正射影像的 Web Mercator 瓦片（带 ETag，浏览器可缓存）"""
+    try:
+        tile = xyz_tile_server.get_tile(run, z, x, y)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if tile is None:
+        return jsonify({"error": f"运行 {run} 不存在"}), 404
+
+    data, etag = tile
+    response = Response(data, mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CONFIG['xyz_tiles']['cache_max_age']
+    return response.make_conditional(request)
 @app.route('/api/get_tree_ids', methods=['GET'])
 def get_tree_ids():
     """获取所有树木 ID"""
@@ -300,6 +553,19 @@ def input_tree_data():
     finally:
         cursor.close()
         connection.close()
+def tree_data_columns(cursor):
+    """
+    tree_data 中可直接返回 JSON 的字段：排除空间列（location 等以 WKB 字节返回，无法序列化），
+    手工补充的属性字段（品种、权属等）保持原样返回
+    """
+    cursor.execute("SHOW COLUMNS FROM tree_data")
+    spatial_types = ('point', 'geometry', 'linestring', 'polygon', 'multi')
+    columns = []
+    for row in cursor.fetchall():
+        column_type = row['Type'].decode() if isinstance(row['Type'], (bytes, bytearray)) else row['Type']
+        if not column_type.lower().startswith(spatial_types):
+            columns.append(row['Field'])
+    return columns
 @app.route('/api/get_tree_data/<int:id>', methods=['GET'])
 def get_tree_data(id):
     """根据 id 获取树木的详细数据"""
@@ -307,7 +573,8 @@ def get_tree_data(id):
         connection = get_db_connection()
         cursor = connection.cursor(dictionary=True)
 
-        cursor.execute("SELECT * FROM tree_data WHERE id = %s", (id,))
+        columns = ', '.join(f'`{c}`' for c in tree_data_columns(cursor))
+        cursor.execute(f"SELECT {columns} FROM tree_data WHERE id = %s", (id,))
         tree_data = cursor.fetchone()
 
         if tree_data:
@@ -327,20 +594,11 @@ def generate_qrcode():
     """
     @function generate_qrcode
     @description 生成二维码的API接口
-    @return {json} 包含二维码base64字符串的响应
+    @return {json} 生成统计信息（files 存储为 generated/skipped/seconds，database 存储为 updated/seconds）
     """
     try:
-        qrcode_base64 = generate_and_save_qrcodes()
-        if qrcode_base64:
-            return jsonify({
-                'status': 'success',
-                'qrcode': qrcode_base64
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'message': '无法生成二维码，请检查数据库连接和数据'
-            }), 500
+        stats = run_qrcode_step()
+        return jsonify({'status': 'success', **stats})
     except Exception as e:
         print(f"API错误: {str(e)}")
         return jsonify({
@@ -348,6 +606,57 @@ def generate_qrcode():
             'message': f'生成二维码时出错: {str(e)}'
         }), 500
 
+@app.route('/api/qrcode/<int:id>', methods=['GET'])
+def get_qrcode(id):
+    """获取树木二维码图片（带 ETag，浏览器可缓存），不存在时即时生成"""
+    try:
+        path = qrcode_store_path(id)
+        if not os.path.exists(path):
+            # 只为存在的树木生成二维码，避免任意 id 的请求写满磁盘
+            if not tree_exists(id):
+                return jsonify({'status': 'error', 'message': f'树木 {id} 不存在'}), 404
+            save_qrcode_file(id)
+        return send_file(path, mimetype='image/png', etag=qrcode_key(id),
+                         max_age=CONFIG['qrcode']['cache_max_age'], conditional=True)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'获取二维码失败: {str(e)}'}), 500
+
+@app.route('/api/labels/export', methods=['GET'])
+def export_labels():
+    """
+    流式导出二维码标签：format=pdf 为 A4 标签页 PDF，format=zip 为 PNG 压缩包
+    筛选条件（可组合）：bbox=minlon,minlat,maxlon,maxlat、id_from、id_to、image_name
+    """
+    export_format = request.args.get('format', 'pdf')
+    if export_format not in ('pdf', 'zip'):
+        return jsonify({"error": "format 参数应为 pdf 或 zip"}), 400
+
+    selection = {
+        'id_from': request.args.get('id_from', type=int),
+        'id_to': request.args.get('id_to', type=int),
+        'image_name': request.args.get('image_name')
+    }
+    if request.args.get('bbox'):
+        try:
+            selection['bbox'] = tuple(map(float, request.args['bbox'].split(',')))
+            min_lon, min_lat, max_lon, max_lat = selection['bbox']
+        except ValueError:
+            return jsonify({"error": "bbox 参数格式应为 minlon,minlat,maxlon,maxlat"}), 400
+        if min_lon > max_lon or min_lat > max_lat:
+            return jsonify({"error": "bbox 范围无效"}), 400
+
+    label_config = CONFIG['labels']
+    trees = iter_label_trees(get_db_connection, selection, CONFIG['tree_query']['stream_batch_size'])
+    if export_format == 'pdf':
+        body = stream_label_pdf(trees, label_config, label_config['workers'])
+        mimetype, filename = 'application/pdf', 'tree_labels.pdf'
+    else:
+        body = stream_label_zip(trees, label_config['zip_chunk_size'], label_config['workers'])
+        mimetype, filename = 'application/zip', 'tree_qrcodes.zip'
+
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
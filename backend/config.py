@@ -11,11 +11,120 @@ CONFIG = {
     'tile_size': 640,
     'weight_file': 'best.pt',  # 修改为你的权重文件名
 
+    # 切片并行配置
+    'tiling': {
+        'num_workers': 0,  # 切片进程数，0 或 1 表示串行，建议设为 CPU 核数
+        'chunk_size': 64,  # 每个进程任务包含的切片数
+        'dsm_format': 'npy',  # DSM切片格式：'npy' 二进制高程数组（推荐），'csv' 逐像素文本
+        'write_dom_tiles': True,  # 是否写出DOM切片PNG，流式检测时可设为 False
+        'align_dsm_to_dom': True,  # DSM与DOM网格不同时，按DOM切片窗口经 WarpedVRT 重采样读取DSM
+        'dsm_resampling': 'bilinear',  # DSM对齐的重采样方法
+        'dsm_warp_mem_limit': 64,  # 每个窗口重采样的内存上限（MB）
+        'mosaic': False  # 镶嵌模式：多个条带组成虚拟镶嵌（VRT）统一切割，切片名带运行编号，互不覆盖
+    },
+
+    # 上传文件 COG 转换配置：上传的DOM/DSM在后台按窗口转换为内部分块、压缩并带概览的 COG，
+    # 后续切片、高程查询和预览都读取 COG
+    'cog': {
+        'enabled': True,
+        'blocksize': 640,  # 内部块大小，与切片大小一致时每个切片恰好对应一个块
+        'compress': 'deflate',  # 压缩方式（无损）：'deflate'、'lzw'、'zstd'
+        'overview_resampling': 'average',  # 概览重采样方法
+        'cog_driver': True,  # GDAL 3.1+ 时使用 COG 驱动按规范重排（概览在前）
+        'keep_uploads': False  # 转换完成后是否保留上传的原始文件
+    },
+
+    # 检测配置
+    'detection': {
+        'batch_size': 8,  # 每次前向传播的切片数，CPU 推理服务器可按吞吐调整
+        'streaming': False,  # 流式模式：直接从DOM窗口读取切片送入模型，不经过PNG
+        'queue_depth': 16,  # 流式模式下内存中缓存的最大切片数
+        'save_tiles': False,  # 流式模式下是否仍写出DOM切片PNG
+        'sliding_window': False,  # 重叠滑窗模式：整幅DOM滑窗检测 + 全局NMS去重
+        'overlap': 128,  # 相邻窗口重叠像素（也可设置 'stride': 512 指定步长）
+        'nms_iou': 0.5  # 全局NMS的IoU阈值
+    },
+
+    # 运行清单配置：SQLite 文件记录每个切片的窗口、输入指纹和各阶段状态，
+    # 重新执行时只处理变化或未完成的切片，崩溃后可断点续跑
+    'manifest': {
+        'enabled': True,
+        'filename': 'manifest.sqlite'  # 位于输出目录下
+    },
+
+    # 坐标转换配置
+    'coordinates': {
+        'source_crs': None,  # 源坐标系，None 表示使用DSM自身的坐标系，例如 'EPSG:32649'
+        'target_crs': 'EPSG:4326',  # 目标坐标系（WGS84经纬度）
+        'transform_chunk_size': 1000000  # 每次批量转换的点数
+    },
+
+    # 后台任务配置
+    'jobs': {
+        'max_workers': 1,  # 执行任务的线程数；切割/检测/坐标/入库共享输出目录，持有流水线锁依次执行，多余的线程只会等锁
+        'max_finished_jobs': 100  # 保留的已结束任务数
+    },
+
+    # 树木查询接口配置
+    'tree_query': {
+        'default_limit': 10000,  # /api/trees 默认返回的最大记录数
+        'max_limit': 50000,  # limit 参数上限
+        'stream_batch_size': 1000,  # /api/trees/list 每次从服务器端游标读取的行数
+        'cluster_cells_per_tile': 16  # /api/trees/clusters 每个瓦片每个方向的聚合网格数
+    },
+
+    # 正射影像瓦片服务配置（/api/tiles/<run>/<z>/<x>/<y>.png）
+    'xyz_tiles': {
+        'tile_size': 256,  # 瓦片像素大小
+        'max_zoom': 24,  # 支持的最大缩放级别
+        'resampling': 'bilinear',  # 重投影到瓦片网格的重采样方法
+        'memory_cache_mb': 256,  # 进程内 LRU 缓存容量（MB）
+        'disk_cache': True,  # 是否将渲染结果缓存到 output/xyz_tiles
+        'cache_max_age': 86400  # 浏览器缓存时间（秒）
+    },
+
+    # 二维码配置
+    'qrcode': {
+        'storage': 'files',  # 'files' 按内容地址保存PNG文件，'database' 写入 tree_data.qrcode（旧方式）
+        'store_dir': os.path.join(BASE_DIR, 'output', 'qrcodes'),  # 二维码文件目录
+        'url_template': 'http://localhost:8080/tree/{tree_id}',  # 二维码内容（前端详情页地址）
+        'workers': os.cpu_count() or 1,  # 并行生成的进程数
+        'chunk_size': 256,  # 每个进程任务包含的二维码数
+        'db_chunk_size': 2000,  # 'database' 模式下每次读取、生成并提交的记录数
+        'cache_max_age': 86400  # /api/qrcode/<id> 的浏览器缓存时间（秒）
+    },
+
+    # 二维码标签导出配置（/api/labels/export）
+    'labels': {
+        'columns': 4,  # 每页标签列数
+        'rows': 6,  # 每页标签行数
+        'dpi': 200,  # 页面渲染分辨率
+        'margin_mm': 8,  # 页边距（毫米）
+        'workers': os.cpu_count() or 1,  # 并行渲染的进程数
+        'zip_chunk_size': 64  # ZIP 导出时每个进程任务包含的二维码数
+    },
+
     # 数据库配置
     'database': {
         'host': 'localhost',
         'user': 'root',
         'password': '123456',
         'database': '橡胶树信息'
+    },
+
+    # 数据库连接池配置（app.py、DatabaseProcessor、DataInputProcessor、qrcode_util 共用）
+    'database_pool': {
+        'pool_size': 10,  # 连接数，mysql-connector 上限为 32
+        'acquire_timeout': 10,  # 池满时等待空闲连接的最长时间（秒）
+        'connection_timeout': 10,  # 建立连接的超时时间（秒）
+        'health_check': True,  # 借出连接前 ping 检查，失效时自动重连
+        'allow_local_infile': False  # 使用 LOAD DATA LOCAL INFILE 导入时需设为 True
+    },
+
+    # 坐标批量导入配置
+    'ingest': {
+        'mode': 'executemany',  # 'executemany' 分批插入，'load_data' 使用 LOAD DATA LOCAL INFILE
+        'chunk_size': 5000,  # executemany 每批行数
+        'tree_id_precision': 11  # tree_id 的 geohash 精度（11 约 0.15m x 0.15m；10 约 1.2m x 0.6m，相邻植穴可能落入同一格）
     }
 }
\ No newline at end of file
@@ -0,0 +1,203 @@
+# backend/utils/cog_ingest.py
+
+import os
+import shutil
+import threading
+import time
+import logging
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.env import GDALVersion
+from rasterio.windows import Window
+from typing import Dict, List, Tuple
+
+# 同一时间只执行一次上传转换，并发提交的转换任务排队执行，后执行的任务会发现文件已转换完成
+_ingest_lock = threading.Lock()
+
+
+def is_cloud_optimized(src) -> bool:
+    """
+    判断数据集是否已是内部分块、压缩且带概览的 GeoTIFF
+    @param src: 已打开的 rasterio 数据集
+    @return: 是否无需转换
+    """
+    return bool(src.driver == 'GTiff' and src.profile.get('tiled') and src.compression and src.overviews(1))
+
+
+def overview_factors(width: int, height: int, blocksize: int) -> List[int]:
+    """
+    计算概览层级：逐级缩小一半，直到整幅影像不超过一个块
+    @param width: 宽度
+    @param height: 高度
+    @param blocksize: 块大小
+    @return: 例如 [2, 4, 8, 16]
+    """
+    factors = []
+    factor = 2
+    while max(width, height) / (factor // 2) > blocksize:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def convert_to_cog(src_path: str, dst_path: str, cog_config: Dict, progress_callback=None) -> Dict:
+    """
+    将 GeoTIFF 转换为内部分块、压缩并带概览的 COG
+    按整行块窗口读取源文件（条带组织的源文件每个条带只读一次），写入临时文件后原子替换，
+    转换失败时删除临时文件
+    @param src_path: 源文件路径
+    @param dst_path: 输出路径
+    @param cog_config: COG 配置（blocksize, compress, overview_resampling, cog_driver）
+    @param progress_callback: 进度回调，参数为本次完成的行块数
+    @return: {'rows': 行数, 'overviews': 概览层级, 'seconds': 耗时}
+    """
+    start_time = time.perf_counter()
+    blocksize = cog_config.get('blocksize', 640)
+    tmp_path = f"{dst_path}.{os.getpid()}.tiling"
+    cog_path = f"{dst_path}.{os.getpid()}.cog"
+
+    try:
+        with rasterio.open(src_path) as src:
+            height = src.height
+            profile = src.profile.copy()
+            profile.update(
+                driver='GTiff',
+                tiled=True,
+                blockxsize=blocksize,
+                blockysize=blocksize,
+                compress=cog_config.get('compress', 'deflate'),
+                predictor=3 if np.dtype(src.dtypes[0]).kind == 'f' else 2,
+                interleave='pixel',
+                BIGTIFF='IF_SAFER'
+            )
+            factors = overview_factors(src.width, src.height, blocksize)
+
+            with rasterio.open(tmp_path, 'w', **profile) as dst:
+                for top in range(0, src.height, blocksize):
+                    window = Window(0, top, src.width, min(blocksize, src.height - top))
+                    dst.write(src.read(window=window), window=window)
+                    if progress_callback:
+                        progress_callback(1)
+
+                if factors:
+                    resampling = cog_config.get('overview_resampling', 'average')
+                    dst.build_overviews(factors, Resampling[resampling])
+                    dst.update_tags(ns='rio_overview', resampling=resampling)
+
+        # GDAL 3.1+ 的 COG 驱动复用已生成的概览，按 COG 规范重排 IFD（概览在前，便于按需读取）
+        if cog_config.get('cog_driver', True) and GDALVersion.runtime().at_least('3.1'):
+            rasterio.shutil.copy(
+                tmp_path, cog_path, driver='COG',
+                BLOCKSIZE=blocksize,
+                COMPRESS=cog_config.get('compress', 'deflate'),
+                PREDICTOR='YES',
+                OVERVIEWS='FORCE_USE_EXISTING',
+                BIGTIFF='IF_SAFER'
+            )
+            os.replace(cog_path, dst_path)
+        else:
+            os.replace(tmp_path, dst_path)
+    finally:
+        for path in (tmp_path, cog_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return {'rows': height, 'overviews': factors, 'seconds': time.perf_counter() - start_time}
+
+
+class UploadIngestor:
+    """
+    上传文件导入：将上传的 GeoTIFF 转换为 COG 后放入输入目录，后续切片、高程查询、预览均读取 COG
+    """
+
+    def __init__(self, config: Dict):
+        """
+        初始化
+        @param config: 配置信息字典（input_dir, cog, progress_callback）
+        """
+        self.config = config
+        self.cog_config = config.get('cog', {})
+        self.upload_dir = os.path.join(config['input_dir'], 'uploads')
+
+        # 设置日志
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+
+        # 进度回调（后台任务使用），参数为本次完成的数量
+        self.progress_callback = config.get('progress_callback')
+
+    def upload_path(self, kind: str, filename: str) -> str:
+        """
+        上传文件的暂存路径
+        @param kind: 'dom' 或 'dsm'
+        @param filename: 文件名
+        @return: input/uploads/<kind>/<filename>
+        """
+        folder = os.path.join(self.upload_dir, kind)
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, os.path.basename(filename))
+
+    def pending_uploads(self) -> List[Tuple[str, str]]:
+        """
+        列出尚未转换的上传文件
+        @return: [(类型, 文件路径), ...]
+        """
+        pending = []
+        for kind in ('dom', 'dsm'):
+            folder = os.path.join(self.upload_dir, kind)
+            if os.path.isdir(folder):
+                pending.extend(
+                    (kind, os.path.join(folder, f)) for f in sorted(os.listdir(folder))
+                    if f.lower().endswith(('.tif', '.tiff'))
+                )
+        return pending
+
+    def ingest_upload(self, kind: str, upload_path: str) -> str:
+        """
+        转换一个上传文件（已是 COG 的文件直接移动），转换完成后删除暂存文件
+        @param kind: 'dom' 或 'dsm'
+        @param upload_path: 上传文件路径
+        @return: 写入输入目录的文件路径
+        """
+        name = os.path.splitext(os.path.basename(upload_path))[0] + '.tif'
+        dst_path = os.path.join(self.config['input_dir'], kind, name)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+
+        with rasterio.open(upload_path) as src:
+            ready = is_cloud_optimized(src)
+
+        if ready:
+            shutil.move(upload_path, dst_path)
+            self.logger.info(f"{name} is already tiled with overviews, moved to {dst_path}")
+            return dst_path
+
+        self.logger.info(f"Start converting {kind.upper()} upload to COG: {name}")
+        stats = convert_to_cog(upload_path, dst_path, self.cog_config, self.progress_callback)
+        self.logger.info(
+            f"✅ COG written: {dst_path} ({stats['rows']} rows, overviews {stats['overviews']}) "
+            f"in {stats['seconds']:.2f}s"
+        )
+        if not self.cog_config.get('keep_uploads', False):
+            os.remove(upload_path)
+        return dst_path
+
+    def ingest_pending(self) -> List[str]:
+        """
+        转换所有尚未转换的上传文件
+        无法转换的文件（损坏或格式不支持）移到 uploads/failed/<kind>，记录错误后继续处理其他文件，
+        不会让后续的切割任务反复失败
+        @return: 新写入输入目录的文件路径列表
+        """
+        with _ingest_lock:
+            converted = []
+            for kind, upload_path in self.pending_uploads():
+                try:
+                    converted.append(self.ingest_upload(kind, upload_path))
+                except Exception as e:
+                    failed_dir = os.path.join(self.upload_dir, 'failed', kind)
+                    os.makedirs(failed_dir, exist_ok=True)
+                    shutil.move(upload_path, os.path.join(failed_dir, os.path.basename(upload_path)))
+                    self.logger.error(f"转换上传文件失败，已移至 {failed_dir}: {upload_path}: {str(e)}")
+            return converted
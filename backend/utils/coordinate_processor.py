@@ -1,10 +1,14 @@
 # backend/utils/coordinate_processor.py
 
+import numpy as np
 import pandas as pd
 import os
+import rasterio
 from pyproj import Transformer
 import logging
-from typing import Dict
+from typing import Dict, Optional, Tuple
+from utils.dsm_tiles import load_dsm_tile, pixel_to_coords
+from utils.run_manifest import fingerprint
 
 
 class CoordinateProcessor:
@@ -25,16 +29,190 @@ class CoordinateProcessor:
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
-        # 初始化坐标转换器
-        self.transformer = Transformer.from_crs("EPSG:32649", "EPSG:4326", always_xy=True)
+        # 坐标转换配置：source_crs 为空时使用DSM自身的坐标系
+        coordinate_config = config.get('coordinates', {})
+        self.source_crs = coordinate_config.get('source_crs')
+        self.target_crs = coordinate_config.get('target_crs', 'EPSG:4326')
+        self.transform_chunk_size = coordinate_config.get('transform_chunk_size', 1000000)
+        self.transformers = {}  # 按源坐标系缓存坐标转换器
+
+        # 进度回调（后台任务使用），参数为本次完成的数量
+        self.progress_callback = config.get('progress_callback')
+
+        # 运行清单（RunManifest）：检测结果和DSM切片都未变化时跳过已处理的切片
+        self.manifest = config.get('manifest')
 
         # 创建输出目录
         self.coordinate_output_dir = os.path.join(config['output_dir'], 'coordinates')
         os.makedirs(self.coordinate_output_dir, exist_ok=True)
 
+    def report_progress(self, n: int = 1):
+        """
+        上报进度（后台任务通过 config['progress_callback'] 传入回调）
+        @param n: 本次完成的数量
+        """
+        if self.progress_callback:
+            self.progress_callback(n)
+
+    def load_dsm_grid(self, dsm_dir: str, base_name: str) -> Optional[Tuple[np.ndarray, object, Optional[str], Optional[float]]]:
+        """
+        读取DSM切片的高程网格及像素到坐标的映射
+        优先读取 .npy 二进制切片（内存映射 + 仿射变换）；否则将CSV还原为网格
+        @param dsm_dir: DSM切片目录
+        @param base_name: 切片基础名称，例如 tile_11_9
+        @return: (高程网格, 坐标映射, 坐标系, 无效值)，坐标映射为 Affine 或 (经度网格, 纬度网格)，
+                 CSV切片不记录坐标系，无效像素已写为 NaN，两者均为 None；未找到切片时返回 None
+        """
+        npy_path = os.path.join(dsm_dir, f'{base_name}.npy')
+        if os.path.exists(npy_path):
+            elevation, transform, sidecar = load_dsm_tile(npy_path)
+            return elevation, transform, sidecar.get('crs'), sidecar.get('nodata')
+
+        csv_path = os.path.join(dsm_dir, f'{base_name}.csv')
+        if os.path.exists(csv_path):
+            df = pd.read_csv(csv_path)
+            df.columns = [col.strip().lower() for col in df.columns]
+
+            # CSV 按行优先顺序逐像素写出，可直接还原为二维网格
+            shape = (int(df['row'].max()) + 1, int(df['col'].max()) + 1)
+            return (
+                df['elevation'].to_numpy().reshape(shape),
+                (df['longitude'].to_numpy().reshape(shape), df['latitude'].to_numpy().reshape(shape)),
+                None,
+                None
+            )
+
+        return None
+
+    def lookup_box_centers(self, detections: np.ndarray, elevation: np.ndarray, pixel_mapping,
+                           nodata: Optional[float] = None) -> np.ndarray:
+        """
+        向量化地将一个切片内所有检测框中心映射到DSM像素，直接按整数下标取值
+        @param detections: (N, 6) 检测结果数组，列为 类别 置信度 x1 y1 x2 y2
+        @param elevation: 高程网格
+        @param pixel_mapping: Affine 或 (经度网格, 纬度网格)
+        @param nodata: 高程无效值（例如对齐到DOM网格后超出DSM覆盖范围的像素）
+        @return: (M, 3) 数组，列为 x, y, elevation（源坐标系），M 为落在切片范围内且高程有效的检测框数
+        """
+        # 计算中心点坐标，取最近的像素
+        x_center = (detections[:, 2] + detections[:, 4]) / 2
+        y_center = (detections[:, 3] + detections[:, 5]) / 2
+        cols = np.rint(x_center).astype(np.int64)
+        rows = np.rint(y_center).astype(np.int64)
+
+        # 丢弃落在DSM切片范围之外的点（例如边缘切片的补黑区域）
+        height, width = elevation.shape
+        valid = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        rows, cols = rows[valid], cols[valid]
+
+        # 丢弃高程无效的点
+        values = np.asarray(elevation[rows, cols], dtype=np.float64)
+        valid = ~np.isnan(values)
+        if nodata is not None:
+            valid &= values != nodata
+        rows, cols, values = rows[valid], cols[valid], values[valid]
+
+        if isinstance(pixel_mapping, tuple):
+            lon_grid, lat_grid = pixel_mapping
+            xs, ys = lon_grid[rows, cols], lat_grid[rows, cols]
+        else:
+            xs, ys = pixel_to_coords(pixel_mapping, rows, cols)
+
+        return np.column_stack([xs, ys, values])
+
+    def default_source_crs(self) -> str:
+        """
+        确定源坐标系：优先使用配置，其次读取输入DSM自身的坐标系
+        @return: 源坐标系字符串
+        """
+        if self.source_crs:
+            return self.source_crs
+
+        dsm_input_dir = os.path.join(self.config.get('input_dir', ''), 'dsm')
+        if os.path.isdir(dsm_input_dir):
+            for dsm_file in sorted(os.listdir(dsm_input_dir)):
+                if dsm_file.endswith('.tif'):
+                    with rasterio.open(os.path.join(dsm_input_dir, dsm_file)) as src:
+                        if src.crs:
+                            return src.crs.to_string()
+
+        self.logger.warning("无法从DSM读取坐标系，使用默认坐标系 EPSG:32649")
+        return "EPSG:32649"
+
+    def get_transformer(self, source_crs: str) -> Transformer:
+        """
+        获取（并缓存）源坐标系到目标坐标系的转换器
+        @param source_crs: 源坐标系
+        @return: pyproj Transformer
+        """
+        if source_crs not in self.transformers:
+            self.transformers[source_crs] = Transformer.from_crs(source_crs, self.target_crs, always_xy=True)
+        return self.transformers[source_crs]
+
+    def transform_points(self, points: np.ndarray, source_crs: str) -> np.ndarray:
+        """
+        批量转换坐标系，按 transform_chunk_size 分块调用一次 Transformer.transform
+        @param points: (N, 3) 数组，列为 x, y, elevation（源坐标系）
+        @param source_crs: 源坐标系
+        @return: (N, 3) 数组，列为 经度, 纬度, 高程
+        """
+        transformer = self.get_transformer(source_crs)
+        result = points.copy()
+        for start in range(0, len(points), self.transform_chunk_size):
+            chunk = slice(start, start + self.transform_chunk_size)
+            result[chunk, 0], result[chunk, 1] = transformer.transform(points[chunk, 0], points[chunk, 1])
+        return result
+
+    def plan_detection_files(self, det_files, detection_dir: str, dsm_dir: str):
+        """
+        根据运行清单确定需要处理的检测文件：检测结果、DSM切片或坐标配置变化，或坐标文件缺失
+        @param det_files: 检测结果文件名列表
+        @param detection_dir: 检测结果目录
+        @param dsm_dir: DSM切片目录
+        @return: (待处理的文件名列表, {切片基础名称: 输入指纹})
+        """
+        det_hashes = self.manifest.stage_hashes('detect')
+        dsm_hashes = self.manifest.stage_hashes('dsm_tiles')
+
+        hashes = {}
+        for det_file in det_files:
+            base_name = det_file.replace('det_', '').replace('.txt', '')
+            # 优先使用上游阶段记录的指纹，没有记录时（例如滑窗检测拆分的结果）直接计算文件哈希
+            det_hash = det_hashes.get(base_name) or self.manifest.file_hash(os.path.join(detection_dir, det_file))
+            dsm_hash = dsm_hashes.get(base_name)
+            if dsm_hash is None:
+                for ext in ('.npy', '.csv'):
+                    dsm_path = os.path.join(dsm_dir, f'{base_name}{ext}')
+                    if os.path.exists(dsm_path):
+                        dsm_hash = self.manifest.file_hash(dsm_path)
+                        break
+            hashes[base_name] = fingerprint(det_hash, dsm_hash, self.source_crs, self.target_crs)
+
+        pending = set(self.manifest.pending('coordinates', hashes))
+        todo = [
+            det_file for det_file in det_files
+            if det_file.replace('det_', '').replace('.txt', '') in pending
+            or not os.path.exists(os.path.join(
+                self.coordinate_output_dir, f"coord_{det_file.replace('det_', '').replace('.txt', '')}.txt"))
+        ]
+        self.logger.info(f"{len(todo)}/{len(det_files)} detection files need coordinate processing")
+        return todo, hashes
+
+    def remove_stale_coordinates(self, det_files):
+        """
+        删除已没有对应检测结果的坐标文件（切片重新检测后没有目标）
+        @param det_files: 当前的检测结果文件名列表
+        """
+        current = {f"coord_{det_file.replace('det_', '')}" for det_file in det_files}
+        for coord_file in os.listdir(self.coordinate_output_dir):
+            if coord_file.endswith('.txt') and coord_file not in current:
+                os.remove(os.path.join(self.coordinate_output_dir, coord_file))
+                self.logger.info(f"Removed stale coordinate file: {coord_file}")
+
     def process_detection_results(self):
         """
         处理YOLO检测结果，只输出经度、纬度和高程信息
+        先匹配所有切片的检测框，再按坐标系分组一次性批量转换
         """
         detection_dir = os.path.join(self.config['output_dir'], 'detection_results')
         dsm_dir = os.path.join(self.config['output_dir'], 'dsm_tiles')
@@ -42,79 +220,87 @@ class CoordinateProcessor:
         # 获取所有检测结果文件
         det_files = [f for f in os.listdir(detection_dir) if f.endswith('.txt')]
 
+        hashes = {}
+        if self.manifest is not None:
+            self.remove_stale_coordinates(det_files)
+            det_files, hashes = self.plan_detection_files(det_files, detection_dir, dsm_dir)
+
+        # 按源坐标系分组收集各切片的匹配结果：{crs: [(base_name, points), ...]}
+        matched = {}
+        empty = []  # 没有有效坐标的切片，删除旧坐标文件并记录为已完成
+        default_crs = None
+
         for det_file in det_files:
             try:
                 # 从检测结果中提取基础名称
                 base_name = det_file.replace('det_', '').replace('.txt', '')  # 获取基础名称，例如 11_9
-                csv_file = f'{base_name}.csv'  # 生成与检测文件一致的CSV文件名
-                csv_path = os.path.join(dsm_dir, csv_file)
-
-                if not os.path.exists(csv_path):
-                    self.logger.warning(f"未找到对应的CSV文件: {csv_file}，跳过该检测文件: {det_file}")
-                    continue
 
                 # 读取检测结果 (格式: 类别 置信度 x1 y1 x2 y2)
                 det_path = os.path.join(detection_dir, det_file)
-                with open(det_path, 'r') as f:
-                    detections = [line.strip().split() for line in f]
+                detections = np.loadtxt(det_path, dtype=np.float64, ndmin=2)
 
-                if not detections:
+                if detections.size == 0:
                     self.logger.warning(f"检测文件为空: {det_file}")
+                    empty.append(base_name)
                     continue
 
-                # 读取并处理CSV文件
-                df = pd.read_csv(csv_path)
-                df.columns = [col.strip().lower() for col in df.columns]
-
-                # 归一化row和col列
-                df['row_normalized'] = df['row'] / self.image_height
-                df['col_normalized'] = df['col'] / self.image_width
-
-                # 处理每个检测框
-                coordinates = []
-                for det in detections:
-                    # 解析检测结果
-                    cls_id, conf, x1, y1, x2, y2 = det  # 解析六列数据
-
-                    # 计算中心点坐标
-                    x_center = (float(x1) + float(x2)) / 2
-                    y_center = (float(y1) + float(y2)) / 2
+                # 读取DSM切片（.npy 或 CSV）
+                dsm_grid = self.load_dsm_grid(dsm_dir, base_name)
+                if dsm_grid is None:
+                    self.logger.warning(f"未找到对应的DSM切片: {base_name}，跳过该检测文件: {det_file}")
+                    continue
+                elevation, pixel_mapping, tile_crs, nodata = dsm_grid
 
-                    # 归一化中心点坐标
-                    x_center_normalized = round(x_center / self.image_width, 6)
-                    y_center_normalized = round(y_center / self.image_height, 6)
+                # 所有检测框一次性匹配
+                points = self.lookup_box_centers(detections, elevation, pixel_mapping, nodata)
+                if not len(points):
+                    self.logger.warning(f'文件 {det_file} 没有找到任何有效的坐标信息')
+                    empty.append(base_name)
+                    continue
 
-                    # 匹配坐标
-                    tolerance = 1e-3
-                    data_point = df[
-                        (abs(df['row_normalized'] - y_center_normalized) < tolerance) &
-                        (abs(df['col_normalized'] - x_center_normalized) < tolerance)
-                    ]
+                if self.source_crs:
+                    source_crs = self.source_crs
+                elif tile_crs:
+                    source_crs = tile_crs
+                else:
+                    if default_crs is None:
+                        default_crs = self.default_source_crs()
+                    source_crs = default_crs
+                matched.setdefault(source_crs, []).append((base_name, points))
 
-                    if not data_point.empty:
-                        # 获取经纬度和高程
-                        longitude = data_point['longitude'].values[0]
-                        latitude = data_point['latitude'].values[0]
-                        elevation = data_point['elevation'].values[0]
+            except Exception as e:
+                self.logger.error(f"处理文件 {det_file} 时出错: {str(e)}")
+            finally:
+                self.report_progress()
 
-                        # 转换坐标系
-                        lon, lat = self.transformer.transform(longitude, latitude)
+        recorder = self.manifest.recorder('coordinates') if self.manifest is not None else None
+        for base_name in empty:
+            # 重新处理后没有有效坐标：删除旧结果，避免入库阶段读取过期坐标
+            output_file = os.path.join(self.coordinate_output_dir, f'coord_{base_name}.txt')
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            if recorder is not None:
+                recorder.add(base_name, hashes[base_name])
+        for source_crs, tiles in matched.items():
+            # 转换坐标系：整批检测框一次转换
+            all_points = self.transform_points(np.concatenate([points for _, points in tiles]), source_crs)
+            self.logger.info(f"Transformed {len(all_points)} points from {source_crs} to {self.target_crs}")
 
-                        # 只保存经度、纬度和高程信息
-                        coordinates.append([lon, lat, elevation])
+            offset = 0
+            for base_name, points in tiles:
+                coordinates = all_points[offset:offset + len(points)]
+                offset += len(points)
 
                 # 保存结果
-                if coordinates:
-                    output_file = os.path.join(self.coordinate_output_dir, f'coord_{base_name}.txt')
-                    with open(output_file, 'w') as f:
-                        for coord in coordinates:
-                            # 只写入经度、纬度、高程
-                            f.write(f"{coord[0]} {coord[1]} {coord[2]}\n")
-                    self.logger.info(f'Coordinates results have been saved to: {output_file}')
-                else:
-                    self.logger.warning(f'文件 {det_file} 没有找到任何有效的坐标信息')
-
-            except Exception as e:
-                self.logger.error(f"处理文件 {det_file} 时出错: {str(e)}")
+                output_file = os.path.join(self.coordinate_output_dir, f'coord_{base_name}.txt')
+                with open(output_file, 'w') as f:
+                    for coord in coordinates:
+                        # 只写入经度、纬度、高程
+                        f.write(f"{coord[0]} {coord[1]} {coord[2]}\n")
+                self.logger.info(f'Coordinates results have been saved to: {output_file}')
+                if recorder is not None:
+                    recorder.add(base_name, hashes[base_name])
+        if recorder is not None:
+            recorder.flush()
 
-        self.logger.info("Coordinate processing for all detection results is completed")
\ No newline at end of file
+        self.logger.info("Coordinate processing for all detection results is completed")
@@ -1,5 +1,6 @@
 import mysql.connector
 import logging
+from utils.db_pool import get_connection
 from typing import Dict
 
 class DataInputProcessor:
@@ -20,15 +21,9 @@ class DataInputProcessor:
         self.logger = logging.getLogger(__name__)
 
     def connect_to_db(self):
-        """建立数据库连接"""
+        """从共享连接池获取数据库连接，close() 时归还"""
         try:
-            connection = mysql.connector.connect(
-                host=self.db_config['host'],
-                user=self.db_config['user'],
-                password=self.db_config['password'],
-                database=self.db_config['database']
-            )
-            return connection
+            return get_connection(self.db_config, self.config.get('database_pool'))
         except mysql.connector.Error as e:
             self.logger.error(f"数据库连接失败: {str(e)}")
             raise
@@ -60,12 +55,12 @@ class DataInputProcessor:
                     insert_query = """
                     INSERT INTO tree_data (tree_id, yield, treeHeight, branchHeight, crownDiameter, 
                                            crossSectionArea, crownArea, crownVolume, biomass,
-                                           longitude, latitude, elevation, image_name)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                           longitude, latitude, elevation, image_name, location)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, POINT(%s, %s))
                     """
                     data = (tree_id, yield_data, tree_height, branchHeight, crownDiameter,
                             crossSectionArea, crownArea, crownVolume, biomass,
-                            longitude, latitude, elevation, image_name)
+                            longitude, latitude, elevation, image_name, longitude, latitude)
                     cursor.execute(insert_query, data)
                     connection.commit()
                     self.logger.info(f"树木数据 {tree_id} 已成功保存到数据库")
@@ -0,0 +1,206 @@
+# backend/utils/db_pool.py
+
+import threading
+import time
+import logging
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from typing import Dict, Optional
+
+
+class PooledConnection:
+    """
+    连接池中借出的连接：close() 时归还连接池并释放占用的名额，其余属性直接代理到底层连接
+    """
+
+    def __init__(self, connection, pool: 'ConnectionPool'):
+        self._connection = connection
+        self._pool = pool
+        self._closed = False
+
+    def close(self):
+        """归还连接（可重复调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._connection.close()
+        finally:
+            self._pool.release()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    MySQL 连接池：固定大小，借出时做健康检查，池满时等待至超时，并记录饱和度指标
+    """
+
+    def __init__(self, db_config: Dict, pool_size: int = 10, acquire_timeout: float = 10.0,
+                 connection_timeout: int = 10, health_check: bool = True, pool_name: str = 'rubber_tree',
+                 **connect_args):
+        """
+        初始化连接池
+        @param db_config: 数据库配置（host, user, password, database）
+        @param pool_size: 连接数
+        @param acquire_timeout: 池满时等待空闲连接的最长时间（秒）
+        @param connection_timeout: 建立连接的超时时间（秒）
+        @param health_check: 借出连接前是否 ping 检查并自动重连
+        @param pool_name: 连接池名称
+        @param connect_args: 其他连接参数，例如 allow_local_infile
+        """
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check = health_check
+        self.logger = logging.getLogger(__name__)
+
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=pool_name,
+            pool_size=pool_size,
+            pool_reset_session=True,
+            connection_timeout=connection_timeout,
+            **db_config,
+            **connect_args
+        )
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+        # 饱和度指标
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquired = 0
+        self._waited = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._wait_seconds = 0.0
+
+    def get_connection(self) -> PooledConnection:
+        """
+        借出一个连接，池满时最多等待 acquire_timeout 秒
+        @return: PooledConnection
+        """
+        start_time = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._waited += 1
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                with self._lock:
+                    self._timeouts += 1
+                raise PoolError(f"获取数据库连接超时（{self.acquire_timeout}s），连接池已满")
+
+        try:
+            connection = self._pool.get_connection()
+            if self.health_check:
+                try:
+                    connection.ping(reconnect=False)
+                except Exception:
+                    # 连接已失效（例如被服务器超时断开），重连后再使用
+                    connection.reconnect(attempts=2, delay=0)
+                    with self._lock:
+                        self._reconnects += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._wait_seconds += time.perf_counter() - start_time
+        return PooledConnection(connection, self)
+
+    def release(self):
+        """归还名额（由 PooledConnection.close 调用）"""
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict:
+        """
+        连接池饱和度指标
+        @return: 指标字典
+        """
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'in_use': self._in_use,
+                'idle': self.pool_size - self._in_use,
+                'peak_in_use': self._peak_in_use,
+                'utilization': self._in_use / self.pool_size,
+                'acquired_total': self._acquired,
+                'waited_total': self._waited,
+                'timeouts_total': self._timeouts,
+                'reconnects_total': self._reconnects,
+                'avg_acquire_ms': self._wait_seconds / self._acquired * 1000 if self._acquired else 0.0
+            }
+
+
+def close_streaming_cursor(cursor, connection, batch_size: int = 1000):
+    """
+    关闭非缓冲游标并归还连接
+    客户端中途断开等情况下结果集尚未读完，直接关闭游标会抛出 "Unread result found"，
+    连接也无法复位归还，因此先分批丢弃剩余结果；无论是否出错，连接都会被关闭
+    @param cursor: 非缓冲游标（可为 None）
+    @param connection: 游标所属连接
+    @param batch_size: 丢弃剩余结果时每次读取的行数
+    """
+    try:
+        if cursor is not None:
+            try:
+                if connection.unread_result:
+                    while cursor.fetchmany(batch_size):
+                        pass
+            finally:
+                cursor.close()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Failed to close streaming cursor cleanly: {str(e)}")
+    finally:
+        connection.close()
+
+
+# 进程内共享的连接池，按数据库配置区分
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_config: Dict, pool_config: Optional[Dict] = None) -> ConnectionPool:
+    """
+    获取（首次调用时创建）共享连接池
+    @param db_config: 数据库配置
+    @param pool_config: 连接池配置（pool_size, acquire_timeout, connection_timeout, health_check）
+    @return: ConnectionPool
+    """
+    key = tuple(sorted(db_config.items()))
+    with _pools_lock:
+        if key not in _pools:
+            pool_config = dict(pool_config or {})
+            pool_config.setdefault('pool_name', f"rubber_tree_{len(_pools)}")
+            _pools[key] = ConnectionPool(db_config, **pool_config)
+        return _pools[key]
+
+
+def get_connection(db_config: Dict, pool_config: Optional[Dict] = None) -> PooledConnection:
+    """
+    从共享连接池借出一个连接，用完后调用 close() 归还
+    @param db_config: 数据库配置
+    @param pool_config: 连接池配置
+    @return: PooledConnection
+    """
+    return get_pool(db_config, pool_config).get_connection()
+
+
+def pool_stats() -> Dict:
+    """
+    所有共享连接池的饱和度指标
+    @return: {数据库名: 指标字典}
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {dict(key).get('database', str(index)): pool.stats() for index, (key, pool) in enumerate(pools)}
@@ -1,5 +1,9 @@
 import mysql.connector
 import os
+import time
+import tempfile
+from utils.db_pool import get_connection
+from utils.geohash import stable_tree_id
 import logging
 from typing import Dict
 
@@ -17,20 +21,33 @@ class DatabaseProcessor:
         self.config = config
         self.db_config = config['database']
 
+        # 批量导入配置：'executemany' 分批插入，'load_data' 使用 LOAD DATA LOCAL INFILE
+        ingest_config = config.get('ingest', {})
+        self.ingest_mode = ingest_config.get('mode', 'executemany')
+        self.chunk_size = ingest_config.get('chunk_size', 5000)
+        self.tree_id_precision = ingest_config.get('tree_id_precision', 11)
+        if self.ingest_mode not in ('executemany', 'load_data'):
+            raise ValueError(f"Unsupported ingest mode: {self.ingest_mode}")
+
         # 设置日志
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
+        # 进度回调（后台任务使用），参数为本次完成的数量
+        self.progress_callback = config.get('progress_callback')
+
+    def report_progress(self, n: int = 1):
+        """
+        上报进度（后台任务通过 config['progress_callback'] 传入回调）
+        @param n: 本次完成的数量
+        """
+        if self.progress_callback:
+            self.progress_callback(n)
+
     def connect_to_db(self):
-        """建立数据库连接"""
+        """从共享连接池获取数据库连接，close() 时归还"""
         try:
-            connection = mysql.connector.connect(
-                host=self.db_config['host'],
-                user=self.db_config['user'],
-                password=self.db_config['password'],
-                database=self.db_config['database']
-            )
-            return connection
+            return get_connection(self.db_config, self.config.get('database_pool'))
         except mysql.connector.Error as err:
             self.logger.error(f"数据库连接失败: {str(err)}")
             raise
@@ -51,6 +68,7 @@ class DatabaseProcessor:
                 image_name VARCHAR(255),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 tree_id VARCHAR(255) NOT NULL,
+                UNIQUE KEY uk_tree_id (tree_id),
                 yield FLOAT,
                 tree_height FLOAT,
                 branch_height FLOAT,
@@ -58,10 +76,14 @@ class DatabaseProcessor:
                 cross_section_area FLOAT,
                 crown_area FLOAT,
                 crown_volume FLOAT,
-                biomass FLOAT
+                biomass FLOAT,
+                location POINT NOT NULL SRID 0,
+                SPATIAL INDEX idx_tree_location (location)
             )
             """
             cursor.execute(create_table_query)
+            self.ensure_spatial_index(cursor)
+            self.check_tree_id_migration(cursor)
             connection.commit()
             self.logger.info("数据表创建成功或已存在")
 
@@ -72,57 +94,305 @@ class DatabaseProcessor:
             cursor.close()
             connection.close()
 
-    def save_coordinates(self):
-        """将坐标结果保存到数据库"""
-        coordinates_dir = os.path.join(self.config['output_dir'], 'coordinates')
+    def ensure_spatial_index(self, cursor, table_name='tree_data'):
+        """
+        为旧表补充空间坐标列 location（POINT(经度, 纬度)）及空间索引
+        @param cursor: 数据库游标
+        @param table_name: 表名
+        """
+        cursor.execute(f"SHOW COLUMNS FROM {table_name} LIKE 'location'")
+        if cursor.fetchone():
+            return
 
-        # 建立数据库连接
+        self.logger.info("未检测到 'location' 字段，正在添加空间列和空间索引...")
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN location POINT NULL SRID 0")
+        cursor.execute(f"UPDATE {table_name} SET location = POINT(longitude, latitude)")
+        cursor.execute(f"ALTER TABLE {table_name} MODIFY location POINT NOT NULL SRID 0")
+        cursor.execute(f"ALTER TABLE {table_name} ADD SPATIAL INDEX idx_tree_location (location)")
+        self.logger.info("'location' 字段及空间索引已添加")
+
+    # tree_id 为 geohash 编号时的格式
+    GEOHASH_ID_PATTERN = '^tree_[0-9b-hjkmnp-z]+$'
+
+    def has_tree_id_index(self, cursor, table_name='tree_data') -> bool:
+        """检查 tree_id 唯一索引是否存在"""
+        cursor.execute(f"SHOW INDEX FROM {table_name} WHERE Key_name = 'uk_tree_id'")
+        return bool(cursor.fetchall())
+
+    def count_stale_tree_ids(self, cursor, table_name='tree_data') -> int:
+        """
+        统计需要改写的 tree_id：旧的按文件编号的 tree_<序号>，或精度低于当前配置的 geohash 编号
+        @return: 记录数
+        """
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {table_name} WHERE tree_id REGEXP '^tree_[0-9]+$' "
+            f"OR (tree_id REGEXP %s AND CHAR_LENGTH(tree_id) < %s)",
+            (self.GEOHASH_ID_PATTERN, len('tree_') + self.tree_id_precision)
+        )
+        return cursor.fetchone()[0]
+
+    def check_tree_id_migration(self, cursor, table_name='tree_data'):
+        """
+        检查旧表是否需要执行 tree_id 迁移；需要时只记录警告，不修改数据
+        （未迁移时重复导入会产生重复记录，迁移需通过 migrate_tree_ids 显式执行）
+        """
+        missing_index = not self.has_tree_id_index(cursor, table_name)
+        stale = self.count_stale_tree_ids(cursor, table_name)
+        if missing_index or stale:
+            self.logger.warning(
+                f"tree_id 需要迁移（唯一索引{'缺失' if missing_index else '已存在'}，{stale} 条旧编号），"
+                f"请在 backend 目录下执行: python -m utils.db_processor --migrate-tree-ids"
+            )
+
+    def migrate_tree_ids(self, table_name='tree_data') -> Dict:
+        """
+        一次性迁移旧表的 tree_id（显式执行）
+        1. 旧的 tree_<序号> 及低精度 geohash 编号改写为当前精度的 geohash 编号
+        2. 唯一索引缺失时，重复记录的人工属性合并到 id 最小的一条，重复记录整行备份到
+           {table_name}_merged（附 merged_into 指向保留的记录）后删除，再添加唯一索引
+        唯一索引已存在时不删除任何记录
+        @param table_name: 表名
+        @return: {'rewritten': 改写数, 'merged': 合并数, 'index_added': 是否添加了唯一索引}
+        """
         connection = self.connect_to_db()
         cursor = connection.cursor()
-
+        stats = {'rewritten': 0, 'merged': 0, 'index_added': False}
         try:
-            # 获取所有坐标文件
-            coord_files = [f for f in os.listdir(coordinates_dir) if f.endswith('.txt')]
+            missing_index = not self.has_tree_id_index(cursor, table_name)
 
-            for coord_file in coord_files:
-                self.logger.info(f"Processing coordinate file: {coord_file}")
-                file_path = os.path.join(coordinates_dir, coord_file)
+            # 有唯一索引时只改写低精度 geohash 编号（细分后不会冲突）；旧序号编号只在无索引时改写
+            condition = "(tree_id REGEXP %s AND CHAR_LENGTH(tree_id) < %s)"
+            if missing_index:
+                condition += " OR tree_id REGEXP '^tree_[0-9]+$'"
+            cursor.execute(
+                f"UPDATE {table_name} SET tree_id = CONCAT('tree_', ST_GeoHash(longitude, latitude, %s)) "
+                f"WHERE {condition}",
+                (self.tree_id_precision, self.GEOHASH_ID_PATTERN, len('tree_') + self.tree_id_precision)
+            )
+            stats['rewritten'] = cursor.rowcount
+            connection.commit()
+            self.logger.info(f"已改写 {stats['rewritten']} 条记录的 tree_id（精度 {self.tree_id_precision}）")
+
+            if not missing_index:
+                self.logger.info("tree_id 唯一索引已存在，跳过重复记录合并")
+                return stats
 
-                # 读取坐标文件
-                with open(file_path, 'r') as f:
-                    coordinates = [line.strip().split() for line in f if line.strip()]  # 过滤空行
+            # 备份将被合并的重复记录
+            merged_table = f"{table_name}_merged"
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {merged_table} LIKE {table_name}")
+            cursor.execute(f"SHOW COLUMNS FROM {merged_table} LIKE 'merged_into'")
+            if not cursor.fetchone():
+                cursor.execute(
+                    f"ALTER TABLE {merged_table} ADD COLUMN merged_into INT, "
+                    f"ADD COLUMN merged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+                )
+
+            connection.start_transaction()
+            cursor.execute(
+                f"INSERT INTO {merged_table} "
+                f"SELECT dup.*, MIN(keep.id), NOW() FROM {table_name} dup JOIN {table_name} keep "
+                f"ON dup.tree_id = keep.tree_id AND dup.id > keep.id GROUP BY dup.id"
+            )
+            stats['merged'] = cursor.rowcount
 
-                # 准备插入语句
-                insert_query = """
-                INSERT INTO tree_data (longitude, latitude, elevation, image_name, tree_id) 
-                VALUES (%s, %s, %s, %s, %s)
+            attributes = ('yield', 'tree_height', 'branch_height', 'crown_diameter', 'cross_section_area',
+                          'crown_area', 'crown_volume', 'biomass')
+            cursor.execute(
+                f"UPDATE {table_name} keep JOIN {table_name} dup ON dup.tree_id = keep.tree_id AND dup.id > keep.id "
+                f"SET " + ', '.join(f"keep.`{col}` = COALESCE(keep.`{col}`, dup.`{col}`)" for col in attributes)
+            )
+            cursor.execute(
+                f"DELETE dup FROM {table_name} dup JOIN {table_name} keep "
+                f"ON dup.tree_id = keep.tree_id AND dup.id > keep.id"
+            )
+            connection.commit()
+            self.logger.info(f"已合并 {stats['merged']} 条重复记录，原记录备份在 {merged_table}")
+
+            cursor.execute(f"ALTER TABLE {table_name} ADD UNIQUE KEY uk_tree_id (tree_id)")
+            stats['index_added'] = True
+            self.logger.info("tree_id 唯一索引已添加")
+            return stats
+
+        except Exception as e:
+            connection.rollback()
+            self.logger.error(f"tree_id 迁移失败: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def iter_coordinate_rows(self, coordinates_dir: str):
+        """
+        逐行读取所有坐标文件，产出待插入的数据行
+        @param coordinates_dir: 坐标文件目录
+        @return: 生成器，依次产出 (longitude, latitude, elevation, image_name, tree_id)
+        """
+        # 获取所有坐标文件
+        coord_files = [f for f in os.listdir(coordinates_dir) if f.endswith('.txt')]
+
+        for coord_file in coord_files:
+            self.logger.info(f"Processing coordinate file: {coord_file}")
+            image_name = os.path.splitext(coord_file.replace('coord_', ''))[0]
+
+            # 读取坐标文件
+            with open(os.path.join(coordinates_dir, coord_file), 'r') as f:
+                coordinates = [line.strip().split() for line in f if line.strip()]  # 过滤空行
+
+            for coord in coordinates:
+                if len(coord) < 3:  # 确保有足够的数据
+                    self.logger.warning(f"跳过无效坐标行: {coord}")
+                    continue
+
+                try:
+                    lon, lat, elev = map(float, coord[:3])  # 取经度、纬度和高程
+                except ValueError as ve:
+                    self.logger.warning(f"无效数据行: {coord} - 错误: {str(ve)}")
+                    continue
+
+                # 由量化坐标生成稳定编号，重复处理同一航次时编号不变
+                tree_id = stable_tree_id(lon, lat, self.tree_id_precision)
+                yield lon, lat, elev, image_name, tree_id
+
+    # tree_id 已存在时只更新坐标和来源切片，保留 id、人工录入的属性和二维码
+    UPSERT_CLAUSE = """
+        ON DUPLICATE KEY UPDATE
+            longitude = VALUES(longitude),
+            latitude = VALUES(latitude),
+            elevation = VALUES(elevation),
+            image_name = VALUES(image_name),
+            location = VALUES(location)
+    """
+
+    def insert_rows_executemany(self, cursor, rows) -> int:
+        """
+        按 chunk_size 分批 executemany 写入（驱动会改写为多行 INSERT），tree_id 已存在时更新坐标
+        @param cursor: 数据库游标
+        @param rows: 数据行迭代器
+        @return: 写入的行数
+        """
+        # location 与经纬度同步写入
+        insert_query = """
+        INSERT INTO tree_data (longitude, latitude, elevation, image_name, tree_id, location) 
+        VALUES (%s, %s, %s, %s, %s, POINT(%s, %s))
+        """ + self.UPSERT_CLAUSE
+        n_rows = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row + (row[0], row[1]))
+            if len(chunk) >= self.chunk_size:
+                cursor.executemany(insert_query, chunk)
+                n_rows += len(chunk)
+                self.report_progress(len(chunk))
+                chunk = []
+        if chunk:
+            cursor.executemany(insert_query, chunk)
+            n_rows += len(chunk)
+            self.report_progress(len(chunk))
+        return n_rows
+
+    def insert_rows_load_data(self, cursor, rows) -> int:
+        """
+        将数据行写入临时文件后用 LOAD DATA LOCAL INFILE 导入临时表，再合并到 tree_data
+        （LOAD DATA 的 REPLACE 会删除旧行并分配新 id，因此不直接导入正式表）
+        需要服务器开启 local_infile，并在连接池配置中设置 allow_local_infile
+        @param cursor: 数据库游标
+        @param rows: 数据行迭代器
+        @return: 写入的行数
+        """
+        n_rows = 0
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, newline='') as f:
+            tmp_path = f.name
+            for lon, lat, elev, image_name, tree_id in rows:
+                f.write(f"{lon!r}\t{lat!r}\t{elev!r}\t{image_name}\t{tree_id}\n")
+                n_rows += 1
+
+        try:
+            cursor.execute("""
+                CREATE TEMPORARY TABLE tree_data_staging (
+                    longitude DOUBLE NOT NULL,
+                    latitude DOUBLE NOT NULL,
+                    elevation DOUBLE NOT NULL,
+                    image_name VARCHAR(255),
+                    tree_id VARCHAR(255) NOT NULL
+                )
+            """)
+            cursor.execute(
                 """
+                LOAD DATA LOCAL INFILE %s INTO TABLE tree_data_staging
+                FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                (longitude, latitude, elevation, image_name, tree_id)
+                """,
+                (tmp_path,)
+            )
+            cursor.execute("""
+                INSERT INTO tree_data (longitude, latitude, elevation, image_name, tree_id, location)
+                SELECT longitude, latitude, elevation, image_name, tree_id, POINT(longitude, latitude)
+                FROM tree_data_staging
+            """ + self.UPSERT_CLAUSE)
+            self.report_progress(n_rows)
+        finally:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS tree_data_staging")
+            os.remove(tmp_path)
+        return n_rows
 
-                # 批量插入数据
-                for index, coord in enumerate(coordinates):
-                    if len(coord) < 3:  # 确保有足够的数据
-                        self.logger.warning(f"跳过无效坐标行: {coord}")
-                        continue
+    def save_coordinates(self):
+        """
+        将坐标结果保存到数据库
+        整次导入在一个事务中完成，按 ingest 配置选择 executemany 分批插入或 LOAD DATA LOCAL INFILE
+        tree_id 由坐标生成且有唯一索引，重复导入同一批结果只会更新已有记录
+        @return: 导入统计信息 {'rows': 行数, 'seconds': 耗时, 'rows_per_sec': 吞吐}
+        """
+        coordinates_dir = os.path.join(self.config['output_dir'], 'coordinates')
+
+        # 建立数据库连接
+        connection = self.connect_to_db()
+        cursor = connection.cursor()
 
-                    try:
-                        lon, lat, elev = map(float, coord[:3])  # 取经度、纬度和高程
-                        image_name = os.path.splitext(coord_file.replace('coord_', ''))[0]
-                        tree_id = f"tree_{index + 1}"  # 生成一个示例 tree_id，您可以根据需要修改
+        try:
+            start_time = time.perf_counter()
+            connection.start_transaction()
 
-                        data = (lon, lat, elev, image_name, tree_id)
-                        cursor.execute(insert_query, data)
-                    except ValueError as ve:
-                        self.logger.warning(f"无效数据行: {coord} - 错误: {str(ve)}")
-                        continue
+            rows = self.iter_coordinate_rows(coordinates_dir)
+            if self.ingest_mode == 'load_data':
+                n_rows = self.insert_rows_load_data(cursor, rows)
+            else:
+                n_rows = self.insert_rows_executemany(cursor, rows)
 
-                connection.commit()
-                self.logger.info(f"Coordinates of the file {coord_file} have been saved to the database")
+            connection.commit()
 
-            self.logger.info("All coordinate data has been successfully saved to the database")
+            elapsed = time.perf_counter() - start_time
+            stats = {'rows': n_rows, 'seconds': elapsed, 'rows_per_sec': n_rows / elapsed if elapsed > 0 else 0.0}
+            self.logger.info(
+                f"All coordinate data has been successfully saved to the database: {n_rows} rows "
+                f"in {elapsed:.2f}s ({stats['rows_per_sec']:.0f} rows/s, mode {self.ingest_mode})"
+            )
+            return stats
 
         except Exception as e:
+            connection.rollback()
             self.logger.error(f"保存坐标到数据库失败: {str(e)}")
             raise
         finally:
             cursor.close()
-            connection.close()
\ No newline at end of file
+            connection.close()
+
+
+if __name__ == '__main__':
+    # 一次性迁移旧表的 tree_id：在 backend 目录下执行 python -m utils.db_processor --migrate-tree-ids
+    import argparse
+    from config import CONFIG
+
+    parser = argparse.ArgumentParser(description='树木数据表维护')
+    parser.add_argument('--migrate-tree-ids', action='store_true', help='改写旧 tree_id，合并重复记录并添加唯一索引')
+    args = parser.parse_args()
+
+    if args.migrate_tree_ids:
+        processor = DatabaseProcessor({
+            'output_dir': CONFIG['output_dir'],
+            'database': CONFIG['database'],
+            'database_pool': CONFIG['database_pool'],
+            'ingest': CONFIG['ingest']
+        })
+        print(processor.migrate_tree_ids())
+    else:
+        parser.print_help()
@@ -5,9 +5,20 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 from ultralytics import YOLO  # ❌ 不要写 .ultralytics，会导致 relative import 错误
+from ultralytics.data.split_dota import get_windows
+from ultralytics.utils import ops
+import numpy as np
+import rasterio
+import torch
 from PIL import Image
+import contextlib
+import queue
+import re
+import threading
+import time
 import logging
-from typing import Dict
+from typing import Dict, Iterable
+from utils.run_manifest import fingerprint
 
 from ultralytics.nn.Addmodule import DFF
 print("✅ 自定义模块导入成功！")
@@ -16,6 +27,61 @@ print("✅ 自定义模块导入成功！")
 
 from PIL import Image
 
+
+class ModelRegistry:
+    """
+    进程级模型注册表：同一权重文件只加载一次，按 (路径, 修改时间) 缓存，权重文件变化时自动重新加载
+    ultralytics 的预测器在每次调用间保存批次、数据集等状态，不是线程安全的，
+    每个模型附带一把推理锁，所有 predict 调用都需持有
+    """
+
+    def __init__(self):
+        self._models = {}  # 权重路径 -> (修改时间, YOLO 模型, 推理锁)
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def get(self, weights_path: str, warmup_batch: int = 1, imgsz: int = 640):
+        """
+        获取已加载的模型，首次加载或权重文件更新时重新加载并预热
+        @param weights_path: 权重文件路径
+        @param warmup_batch: 预热时的批大小
+        @param imgsz: 预热时的输入尺寸
+        @return: (YOLO 模型, 推理锁)
+        """
+        weights_path = os.path.abspath(weights_path)
+        mtime = os.path.getmtime(weights_path)
+
+        with self._lock:
+            cached = self._models.get(weights_path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1], cached[2]
+
+            if cached is not None:
+                self.logger.info(f"Weights file changed, reloading model: {weights_path}")
+            start_time = time.perf_counter()
+            model = YOLO(weights_path)
+            self.warmup(model, warmup_batch, imgsz)
+            predict_lock = threading.Lock()
+            self._models[weights_path] = (mtime, model, predict_lock)
+            self.logger.info(f"Model loaded and warmed up in {time.perf_counter() - start_time:.2f}s: {weights_path}")
+            return model, predict_lock
+
+    @staticmethod
+    def warmup(model, batch: int, imgsz: int):
+        """
+        预热模型：先用空白图像完成一次推理以构建预测器（AutoBackend），再调用 AutoBackend.warmup
+        @param model: YOLO 模型
+        @param batch: 批大小
+        @param imgsz: 输入尺寸
+        """
+        model.predict(source=np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+        model.predictor.model.warmup(imgsz=(batch, 3, imgsz, imgsz))
+
+
+# 进程内共享的模型注册表
+model_registry = ModelRegistry()
+
+
 class RubberTreeDetector:
     """
     橡胶树检测器：使用YOLOv11对切割好的DOM图片进行检测
@@ -29,64 +95,444 @@ class RubberTreeDetector:
         self.config = config
         self.weights_path = os.path.join(config['weights_dir'], 'best.pt')  # 使用 weights_file
 
+        # 批量推理配置：每次前向传播包含的切片数
+        detection_config = config.get('detection', {})
+        self.batch_size = max(1, int(detection_config.get('batch_size', 1)))
+
+        # 流式检测配置：队列深度限制内存中的切片数，save_tiles 为 True 时额外写出切片PNG
+        self.queue_depth = max(1, int(detection_config.get('queue_depth', 16)))
+        self.save_tiles = detection_config.get('save_tiles', False)
+
+        # 重叠滑窗配置：overlap 为相邻窗口的重叠像素，也可直接指定 stride（步长）
+        self.tile_size = 640
+        self.sliding_window = detection_config.get('sliding_window', False)
+        stride = detection_config.get('stride')
+        self.overlap = self.tile_size - stride if stride else detection_config.get('overlap', 128)
+        if not 0 <= self.overlap < self.tile_size:
+            raise ValueError(f"Invalid sliding window overlap: {self.overlap}")
+        self.nms_iou = detection_config.get('nms_iou', 0.5)
+
         # 设置日志
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
+        # 进度回调（后台任务使用），参数为本次完成的数量
+        self.progress_callback = config.get('progress_callback')
+
+        # 运行清单（RunManifest）：权重和切片都未变化时跳过已检测的切片
+        self.manifest = config.get('manifest')
+
+        # 切片名前缀，从DOM直接检测时沿用 ImageProcessor 的前缀（镶嵌模式下带运行编号）
+        self.tile_prefix = 'tile'
+
         # 创建输出目录
         self.detection_output_dir = os.path.join(config['output_dir'], 'detection_results')
         os.makedirs(self.detection_output_dir, exist_ok=True)
 
-        # 加载模型
+        # 加载模型（从进程级注册表获取，只有权重文件变化时才重新加载）
         try:
-            self.model = YOLO(self.weights_path)
+            self.model, self.predict_lock = model_registry.get(self.weights_path, warmup_batch=self.batch_size, imgsz=self.tile_size)
             self.logger.info("Model loaded successfully")
         except Exception as e:
             self.logger.error(f"加载模型失败: {str(e)}")
             raise
 
+    def report_progress(self, n: int = 1):
+        """
+        上报进度（后台任务通过 config['progress_callback'] 传入回调）
+        @param n: 本次完成的数量
+        """
+        if self.progress_callback:
+            self.progress_callback(n)
+
+    def tile_name(self, i: int, j: int) -> str:
+        """切片名称，与 ImageProcessor.tile_name 一致"""
+        return f'{self.tile_prefix}_{i}_{j}'
+
+    def detection_hash(self, tile_hash: str, *params) -> str:
+        """
+        计算检测阶段的输入指纹：切片指纹 + 模型权重指纹 + 检测参数
+        @param tile_hash: 切片（或整幅DOM）的输入指纹
+        @param params: 其他影响检测结果的参数
+        @return: 指纹
+        """
+        return fingerprint(tile_hash, self.manifest.file_hash(self.weights_path), self.tile_size, *params)
+
+    def manifest_recorder(self):
+        """检测阶段的清单记录器，未启用清单时返回 None"""
+        if self.manifest is None:
+            return None
+        return self.manifest.recorder('detect', flush_every=max(64, self.batch_size),
+                                      model_hash=self.manifest.file_hash(self.weights_path))
+
+    def save_result(self, result, base_name: str):
+        """
+        保存单个切片的检测结果
+        @param result: ultralytics Results 对象
+        @param base_name: 切片基础文件名，例如 tile_0_0
+        """
+        # 保存带标注的图片，保持原始文件名
+        result_path = os.path.join(self.detection_output_dir, f'det_{base_name}.png')
+        result.save(result_path)
+
+        # 保存检测框信息到txt文件，保持原始文件名
+        boxes = result.boxes
+        txt_path = os.path.join(self.detection_output_dir, f'det_{base_name}.txt')
+        if len(boxes) == 0:
+            # 重新检测后没有目标时删除旧结果，避免坐标阶段读取过期数据
+            if os.path.exists(txt_path):
+                os.remove(txt_path)
+        else:
+            with open(txt_path, 'w') as f:
+                for box in boxes:
+                    # 获取检测框信息
+                    x1, y1, x2, y2 = box.xyxy[0].tolist()
+                    conf = box.conf[0].item()
+                    cls = box.cls[0].item()
+                    # 写入格式：类别 置信度 x1 y1 x2 y2
+                    f.write(f"{int(cls)} {conf:.4f} {x1:.2f} {y1:.2f} {x2:.2f} {y2:.2f}\n")
+
     def detect_tiles(self):
         """
         对所有切割好的DOM图片进行检测
+        每次前向传播送入 batch_size 张切片
         """
         dom_tiles_dir = os.path.join(self.config['output_dir'], 'dom_tiles')
 
         try:
             # 获取所有PNG图片
-            for tile_file in os.listdir(dom_tiles_dir):
-                if tile_file.endswith('.png'):
-                    tile_path = os.path.join(dom_tiles_dir, tile_file)
-                    self.logger.info(f"Processing image: {tile_file}")
-
-                    # 获取基础文件名（不包含扩展名）
-                    base_name = os.path.splitext(tile_file)[0]  # 例如：example_0_0
-
-                    # 执行检测
-                    results = self.model(tile_path)
-
-                    # 保存检测结果
-                    for result in results:
-                        # 保存带标注的图片，保持原始文件名
-                        result_path = os.path.join(self.detection_output_dir, f'det_{base_name}.png')
-                        result.save(result_path)
-
-                        # 保存检测框信息到txt文件，保持原始文件名
-                        boxes = result.boxes
-                        if len(boxes) > 0:
-                            txt_path = os.path.join(self.detection_output_dir, f'det_{base_name}.txt')
-                            with open(txt_path, 'w') as f:
-                                for box in boxes:
-                                    # 获取检测框信息
-                                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                                    conf = box.conf[0].item()
-                                    cls = box.cls[0].item()
-                                    # 写入格式：类别 置信度 x1 y1 x2 y2
-                                    f.write(f"{int(cls)} {conf:.4f} {x1:.2f} {y1:.2f} {x2:.2f} {y2:.2f}\n")
-
-                    self.logger.info(f"Image processing completed: {tile_file}")
+            tile_paths = [
+                os.path.join(dom_tiles_dir, tile_file)
+                for tile_file in sorted(os.listdir(dom_tiles_dir)) if tile_file.endswith('.png')
+            ]
+            if not tile_paths:
+                self.logger.warning(f"未找到待检测的切片: {dom_tiles_dir}")
+                return
+
+            # 根据运行清单跳过切片和权重都未变化的已检测切片
+            hashes = {}
+            if self.manifest is not None:
+                tile_hashes = self.manifest.stage_hashes('dom_tiles')
+                for path in tile_paths:
+                    base_name = os.path.splitext(os.path.basename(path))[0]
+                    tile_hash = tile_hashes.get(base_name) or self.manifest.file_hash(path)
+                    hashes[base_name] = self.detection_hash(tile_hash)
+                pending = set(self.manifest.pending('detect', hashes))
+                self.logger.info(f"{len(pending)}/{len(tile_paths)} tiles need detection")
+                tile_paths = [p for p in tile_paths if os.path.splitext(os.path.basename(p))[0] in pending]
+                if not tile_paths:
+                    self.logger.info("All tiles are up to date, detection skipped")
+                    return
+
+            start_time = time.perf_counter()
+            n_tiles = 0
+            with contextlib.ExitStack() as stack:
+                recorder = self.manifest_recorder()
+                if recorder is not None:
+                    stack.enter_context(recorder)
+                # 流式预测在整个迭代过程中使用同一个预测器，迭代期间持有推理锁
+                stack.enter_context(self.predict_lock)
+                # 传入切片路径列表，按 batch_size 张一批前向传播
+                for result in self.model.predict(source=tile_paths, batch=self.batch_size, stream=True, verbose=False):
+                    # 获取基础文件名（不包含扩展名），例如：tile_0_0
+                    base_name = os.path.splitext(os.path.basename(result.path))[0]
+                    self.save_result(result, base_name)
+                    if recorder is not None:
+                        recorder.add(base_name, hashes[base_name])
+                    n_tiles += 1
+                    self.report_progress()
+                    self.logger.debug(f"Image processing completed: {base_name}")
+
+            elapsed = time.perf_counter() - start_time
+            self.logger.info(
+                f"All image detection completed: {n_tiles} tiles in {elapsed:.2f}s "
+                f"({n_tiles / elapsed if elapsed > 0 else 0.0:.1f} tiles/s, batch size {self.batch_size})"
+            )
+
+        except Exception as e:
+            self.logger.error(f"检测过程出错: {str(e)}")
+            raise
+
+    def detect_stream(self, tiles: Iterable, handle_result=None):
+        """
+        流式检测：切片以 numpy 数组形式直接送入模型，不经过PNG落盘
+        读取线程与推理之间使用有界队列，内存中最多保留 queue_depth + batch_size 个切片
+        @param tiles: 可迭代对象，产出 ((i, j), RGB 数组, 切片仿射变换)
+        @param handle_result: 结果回调 (切片键, RGB 数组, 仿射变换, Results)，默认按切片保存结果
+        @return: 检测的切片数
+        """
+        tile_queue = queue.Queue(maxsize=self.queue_depth)
+        done = object()  # 读取结束标记
+        stop = threading.Event()  # 推理出错时通知读取线程退出
+        errors = []
+
+        def put(item) -> bool:
+            # 队列满时定期检查停止标记，推理端已退出时不再阻塞
+            while not stop.is_set():
+                try:
+                    tile_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for tile in tiles:
+                    if not put(tile):
+                        break
+            except Exception as e:
+                errors.append(e)
+            finally:
+                # 关闭生成器，释放其中打开的栅格数据集
+                if hasattr(tiles, 'close'):
+                    tiles.close()
+                put(done)
+
+        if self.save_tiles:
+            os.makedirs(os.path.join(self.config['output_dir'], 'dom_tiles'), exist_ok=True)
+
+        reader = threading.Thread(target=produce, daemon=True)
+        reader.start()
+
+        start_time = time.perf_counter()
+        n_tiles = 0
+        finished = False
+        try:
+            while not finished:
+                # 凑满一个批次
+                batch = []
+                while len(batch) < self.batch_size:
+                    tile = tile_queue.get()
+                    if tile is done:
+                        finished = True
+                        break
+                    batch.append(tile)
+                if not batch:
+                    break
+
+                # LoadPilAndNumpy 约定 numpy 输入为 BGR 顺序
+                images = [np.ascontiguousarray(rgb[:, :, ::-1]) for _, rgb, _ in batch]
+                with self.predict_lock:
+                    results = self.model.predict(source=images, verbose=False)
+
+                for (key, rgb, affine), result in zip(batch, results):
+                    (handle_result or self.handle_tile_result)(key, rgb, affine, result)
+                    n_tiles += 1
+                    self.report_progress()
+        finally:
+            # 无论是否出错都让读取线程退出：设置停止标记并清空队列，避免其阻塞在 put 上
+            stop.set()
+            while reader.is_alive():
+                try:
+                    tile_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            reader.join()
+
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - start_time
+        self.logger.info(
+            f"Streaming detection completed: {n_tiles} tiles in {elapsed:.2f}s "
+            f"({n_tiles / elapsed if elapsed > 0 else 0.0:.1f} tiles/s, batch size {self.batch_size})"
+        )
+        return n_tiles
+
+    def handle_tile_result(self, key, rgb, affine, result):
+        """
+        流式检测的默认结果处理：按切片保存检测结果（可选写出切片PNG）
+        @param key: 切片键 (i, j)
+        @param rgb: 切片 RGB 数组
+        @param affine: 切片仿射变换
+        @param result: ultralytics Results 对象
+        """
+        base_name = self.tile_name(*key)
+        if self.save_tiles:
+            dom_tiles_dir = os.path.join(self.config['output_dir'], 'dom_tiles')
+            Image.fromarray(rgb).save(os.path.join(dom_tiles_dir, f'{base_name}.png'), 'PNG')
+        self.save_result(result, base_name)
+
+    def detect_dom_stream(self, dom_path: str, image_processor):
+        """
+        流式检测一幅DOM，启用运行清单时只检测输入或权重发生变化的切片
+        @param dom_path: DOM文件路径
+        @param image_processor: ImageProcessor 实例
+        """
+        if self.manifest is None:
+            self.detect_stream(image_processor.iter_dom_tiles(dom_path))
+            return
+
+        tiles = image_processor.list_tiles(dom_path)
+        # 与切片阶段使用相同的切片指纹，切片PNG和流式检测结果可以互相复用
+        tile_hashes = image_processor.tile_input_hashes(dom_path, tiles, '.png')
+        hashes = {key: self.detection_hash(tile_hash) for key, tile_hash in tile_hashes.items()}
+        pending = set(self.manifest.pending('detect', hashes))
+        tiles = [t for t in tiles if self.tile_name(t[0], t[1]) in pending]
+        self.logger.info(f"{os.path.basename(dom_path)}: {len(tiles)}/{len(hashes)} tiles need detection")
+        if not tiles:
+            return
+
+        with self.manifest_recorder() as recorder:
+            def handle(key, rgb, affine, result):
+                self.handle_tile_result(key, rgb, affine, result)
+                base_name = self.tile_name(*key)
+                recorder.add(base_name, hashes[base_name])
+
+            self.detect_stream(image_processor.iter_dom_tiles(dom_path, tiles), handle_result=handle)
+
+    def global_nms(self, boxes: np.ndarray, max_wh: int) -> np.ndarray:
+        """
+        对整幅正射影像的检测框做全局NMS，去除重叠窗口产生的重复框
+        @param boxes: (N, 6) 数组，列为 x1 y1 x2 y2 置信度 类别（全局像素坐标）
+        @param max_wh: 类别偏移量，需大于影像最大边长，保证不同类别的框互不抑制
+        @return: 去重后的 (M, 6) 数组
+        """
+        if not len(boxes):
+            return boxes
+
+        # 构造 non_max_suppression 所需的 (1, 4 + nc, N) 预测张量：xywh + 各类别置信度
+        n = len(boxes)
+        nc = int(boxes[:, 5].max()) + 1
+        prediction = torch.zeros((1, 4 + nc, n), dtype=torch.float32)
+        xyxy = torch.from_numpy(boxes[:, :4]).float()
+        prediction[0, :4] = ops.xyxy2xywh(xyxy).T
+        prediction[0, 4 + torch.from_numpy(boxes[:, 5]).long(), torch.arange(n)] = torch.from_numpy(boxes[:, 4]).float()
+
+        kept = ops.non_max_suppression(
+            prediction,
+            conf_thres=0.0,
+            iou_thres=self.nms_iou,
+            nc=nc,
+            max_det=n,
+            max_nms=n,
+            max_wh=max_wh,
+            max_time_img=60.0
+        )[0]
+        return kept.cpu().numpy().astype(np.float64)
+
+    def detect_sliding_window(self, dom_path: str, image_processor):
+        """
+        重叠滑窗检测整幅DOM：各窗口的检测框平移到全局像素坐标后做全局NMS，
+        生成一张全局检测表，并按 640 网格切片重新拆分为 det_tile_i_j.txt 供坐标处理使用
+        @param dom_path: DOM文件路径
+        @param image_processor: ImageProcessor 实例
+        @return: 去重后的 (M, 6) 全局检测框数组
+        """
+        with rasterio.open(dom_path) as src:
+            height, width = src.height, src.width
+
+        # 窗口划分沿用 split_dota.get_windows，最后一个窗口贴齐图像边缘
+        windows = get_windows((height, width), crop_sizes=(self.tile_size,), gaps=(self.overlap,), im_rate_thr=0.0)
+        self.logger.info(
+            f"Sliding window detection: {len(windows)} windows "
+            f"(stride {self.tile_size - self.overlap}, overlap {self.overlap})"
+        )
+
+        all_boxes = []
+
+        def collect(key, rgb, affine, result):
+            boxes = result.boxes
+            if len(boxes) == 0:
+                return
+            x_off, y_off = key
+            data = np.column_stack([
+                boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy()
+            ]).astype(np.float64)
+            data[:, [0, 2]] += x_off
+            data[:, [1, 3]] += y_off
+            all_boxes.append(data)
+
+        self.detect_stream(image_processor.iter_dom_windows(dom_path, windows), handle_result=collect)
+
+        boxes = np.concatenate(all_boxes) if all_boxes else np.zeros((0, 6))
+        kept = self.global_nms(boxes, max_wh=max(height, width) + self.tile_size)
+        self.logger.info(f"Global NMS: {len(boxes)} boxes -> {len(kept)} boxes")
+
+        # 保存全局检测表（全局像素坐标）
+        global_dir = os.path.join(self.detection_output_dir, 'global')
+        os.makedirs(global_dir, exist_ok=True)
+        global_path = os.path.join(global_dir, f'{os.path.splitext(os.path.basename(dom_path))[0]}.txt')
+        with open(global_path, 'w') as f:
+            for x1, y1, x2, y2, conf, cls in kept:
+                f.write(f"{int(cls)} {conf:.4f} {x1:.2f} {y1:.2f} {x2:.2f} {y2:.2f}\n")
+        self.logger.info(f"Global detection table saved to: {global_path}")
+
+        # 先删除该前缀下已有的切片检测结果（之前的滑窗结果或网格模式的结果），
+        # 否则本次没有检测框的切片会保留旧结果，被坐标阶段重复导入
+        self.remove_tile_results()
+
+        # 按中心点所在的网格切片拆分，坐标换算为切片内坐标
+        centers = (kept[:, 0:2] + kept[:, 2:4]) / 2
+        tile_ij = np.floor(centers / self.tile_size).astype(np.int64)
+        for i, j in np.unique(tile_ij, axis=0):
+            in_tile = kept[(tile_ij[:, 0] == i) & (tile_ij[:, 1] == j)]
+            txt_path = os.path.join(self.detection_output_dir, f'det_{self.tile_name(i, j)}.txt')
+            with open(txt_path, 'w') as f:
+                for x1, y1, x2, y2, conf, cls in in_tile:
+                    x1, x2 = x1 - i * self.tile_size, x2 - i * self.tile_size
+                    y1, y2 = y1 - j * self.tile_size, y2 - j * self.tile_size
+                    f.write(f"{int(cls)} {conf:.4f} {x1:.2f} {y1:.2f} {x2:.2f} {y2:.2f}\n")
+
+        return kept
+
+    def remove_tile_results(self):
+        """
+        删除当前切片名前缀下的所有切片检测结果 det_<prefix>_i_j.txt
+        """
+        pattern = re.compile(rf'^det_({re.escape(self.tile_prefix)}_-?\d+_-?\d+)\.txt$')
+        removed = []
+        for name in os.listdir(self.detection_output_dir):
+            match = pattern.match(name)
+            if match:
+                os.remove(os.path.join(self.detection_output_dir, name))
+                removed.append(match.group(1))
+        if removed:
+            # 网格/流式模式记录的切片检测状态随结果一起失效
+            if self.manifest is not None:
+                self.manifest.forget('detect', removed)
+            self.logger.info(f"Removed {len(removed)} previous tile detection files")
+
+    def detect_sliding_window_cached(self, dom_path: str, image_processor):
+        """
+        滑窗检测需要全局NMS，以整幅DOM为单位记录在运行清单中，DOM和权重都未变化时跳过
+        @param dom_path: DOM文件路径
+        @param image_processor: ImageProcessor 实例
+        """
+        if self.manifest is None:
+            self.detect_sliding_window(dom_path, image_processor)
+            return
+
+        key = f'global_{os.path.splitext(os.path.basename(dom_path))[0]}'
+        input_hash = self.detection_hash(self.manifest.file_hash(dom_path), 'sliding', self.overlap, self.nms_iou)
+        if not self.manifest.pending('detect', {key: input_hash}):
+            self.logger.info(f"{os.path.basename(dom_path)} is up to date, sliding window detection skipped")
+            return
+
+        self.detect_sliding_window(dom_path, image_processor)
+        with self.manifest_recorder() as recorder:
+            recorder.add(key, input_hash)
+
+    def detect_rasters(self, image_processor):
+        """
+        直接从输入目录中的DOM文件（镶嵌模式下为虚拟镶嵌）检测（流式切片或重叠滑窗）
+        @param image_processor: ImageProcessor 实例，提供窗口读取切片的生成器
+        """
+        try:
+            dom_paths, _ = image_processor.input_rasters()
+            self.tile_prefix = image_processor.tile_prefix
+            for dom_path in dom_paths:
+                dom_file = os.path.basename(dom_path)
+                if self.sliding_window:
+                    self.logger.info(f"Start sliding window detection on DOM file: {dom_file}")
+                    self.detect_sliding_window_cached(dom_path, image_processor)
+                else:
+                    self.logger.info(f"Start streaming detection on DOM file: {dom_file}")
+                    self.detect_dom_stream(dom_path, image_processor)
 
             self.logger.info("All image detection completed")
 
         except Exception as e:
             self.logger.error(f"检测过程出错: {str(e)}")
-            raise
\ No newline at end of file
+            raise
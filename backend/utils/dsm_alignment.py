@@ -0,0 +1,83 @@
+# backend/utils/dsm_alignment.py
+
+import contextlib
+import os
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from typing import Dict, List, Optional
+
+# DSM 没有设置 nodata 时，对齐后超出 DSM 覆盖范围的像素使用的无效值
+DEFAULT_NODATA = -9999.0
+
+
+def raster_grid(tif_path: str) -> Dict:
+    """
+    读取栅格网格（坐标系、仿射变换、尺寸），结果可序列化后传给切片进程
+    @param tif_path: TIFF文件路径
+    @return: {'crs': WKT 或 None, 'transform': 仿射变换 6 参数, 'width': 宽度, 'height': 高度}
+    """
+    with rasterio.open(tif_path) as src:
+        return {
+            'crs': src.crs.to_wkt() if src.crs else None,
+            'transform': tuple(src.transform)[:6],
+            'width': src.width,
+            'height': src.height
+        }
+
+
+def same_grid(src, grid: Dict) -> bool:
+    """
+    判断数据集是否已与目标网格完全一致（无需重采样）
+    @param src: 已打开的 rasterio 数据集
+    @param grid: raster_grid 返回的网格
+    @return: 是否一致
+    """
+    same_crs = grid['crs'] is None or (src.crs is not None and src.crs == CRS.from_wkt(grid['crs']))
+    return (same_crs and src.width == grid['width'] and src.height == grid['height']
+            and src.transform.almost_equals(Affine(*grid['transform'])))
+
+
+@contextlib.contextmanager
+def aligned_dataset(src, align_to: Optional[Dict] = None):
+    """
+    将DSM按窗口对齐到DOM网格：通过 WarpedVRT 在读取每个窗口时按需重采样，不生成整幅重采样栅格
+    @param src: 已打开的DSM数据集
+    @param align_to: 目标网格（raster_grid 的结果，可附带 resampling、warp_mem_limit），为 None 时不对齐
+    @return: 上下文管理器，产出可按 DOM 像素窗口读取的数据集
+    """
+    if align_to is None or same_grid(src, align_to):
+        yield src
+        return
+
+    with WarpedVRT(
+        src,
+        crs=CRS.from_wkt(align_to['crs']) if align_to['crs'] else src.crs,
+        transform=Affine(*align_to['transform']),
+        width=align_to['width'],
+        height=align_to['height'],
+        resampling=Resampling[align_to.get('resampling', 'bilinear')],
+        nodata=src.nodata if src.nodata is not None else DEFAULT_NODATA,
+        dtype='float32',
+        warp_mem_limit=align_to.get('warp_mem_limit', 64)
+    ) as vrt:
+        yield vrt
+
+
+def match_dom_for_dsm(dsm_path: str, dom_paths: List[str]) -> Optional[str]:
+    """
+    为DSM选择对齐目标DOM：优先选择同名文件，只有一幅DOM时直接使用
+    @param dsm_path: DSM文件路径
+    @param dom_paths: DOM文件路径列表
+    @return: DOM文件路径，无法确定时返回 None
+    """
+    stem = os.path.splitext(os.path.basename(dsm_path))[0].lower()
+    for dom_path in dom_paths:
+        dom_stem = os.path.splitext(os.path.basename(dom_path))[0].lower()
+        if dom_stem == stem or dom_stem.replace('dom', '') == stem.replace('dsm', ''):
+            return dom_path
+    if len(dom_paths) == 1:
+        return dom_paths[0]
+    return None
@@ -0,0 +1,79 @@
+# backend/utils/dsm_tiles.py
+
+import json
+import os
+import numpy as np
+from affine import Affine
+from typing import Dict, Optional, Tuple
+
+
+def dsm_sidecar_path(npy_path: str) -> str:
+    """
+    获取DSM切片对应的仿射变换说明文件路径
+    @param npy_path: 高程数组 .npy 文件路径
+    @return: 同名 .json 文件路径
+    """
+    return os.path.splitext(npy_path)[0] + '.json'
+
+
+def save_dsm_tile(tile_data: np.ndarray, tile_transform: Affine, npy_path: str,
+                  crs: Optional[str] = None, nodata: Optional[float] = None):
+    """
+    以二进制格式保存DSM切片：float32 高程数组 (.npy) + 仿射变换说明文件 (.json)
+    经纬度不再逐像素保存，需要时由仿射变换计算
+    @param tile_data: 切片高程数据
+    @param tile_transform: 切片左上角像素对应的仿射变换
+    @param npy_path: 输出 .npy 文件路径
+    @param crs: 坐标系（WKT 或 EPSG 字符串）
+    @param nodata: 无效值
+    """
+    np.save(npy_path, np.ascontiguousarray(tile_data, dtype=np.float32))
+
+    sidecar = {
+        'transform': list(tile_transform)[:6],
+        'crs': crs,
+        'nodata': nodata,
+        'height': int(tile_data.shape[0]),
+        'width': int(tile_data.shape[1])
+    }
+    with open(dsm_sidecar_path(npy_path), 'w') as f:
+        json.dump(sidecar, f)
+
+
+def load_dsm_tile(npy_path: str) -> Tuple[np.ndarray, Affine, Dict]:
+    """
+    以内存映射方式读取DSM切片
+    @param npy_path: .npy 文件路径
+    @return: (高程数组, 仿射变换, 说明信息)
+    """
+    elevation = np.load(npy_path, mmap_mode='r')
+    with open(dsm_sidecar_path(npy_path), 'r') as f:
+        sidecar = json.load(f)
+    return elevation, Affine(*sidecar['transform']), sidecar
+
+
+def pixel_to_coords(transform: Affine, rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    向量化计算像素行列号对应的投影坐标（像素左上角，与CSV格式一致）
+    @param transform: 仿射变换
+    @param rows: 行号数组
+    @param cols: 列号数组
+    @return: (x 数组, y 数组)
+    """
+    cols = np.asarray(cols, dtype=np.float64)
+    rows = np.asarray(rows, dtype=np.float64)
+    x = transform.a * cols + transform.b * rows + transform.c
+    y = transform.d * cols + transform.e * rows + transform.f
+    return x, y
+
+
+def tile_coordinate_grid(transform: Affine, height: int, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    向量化计算整个切片的坐标网格
+    @param transform: 仿射变换
+    @param height: 切片高度
+    @param width: 切片宽度
+    @return: (x 网格, y 网格)，形状均为 (height, width)
+    """
+    rows, cols = np.mgrid[0:height, 0:width]
+    return pixel_to_coords(transform, rows, cols)
@@ -2,10 +2,14 @@
 
 import os
 import logging
+import numpy as np
 import pandas as pd
 import rasterio
+from rasterio.windows import Window
+from pyproj import Transformer
 from PIL import Image, ImageDraw, ImageFont
-from typing import Dict, List
+from typing import Dict, Tuple
+from utils.dsm_tiles import pixel_to_coords, tile_coordinate_grid
 
 class DsmToDomWithMatching:
     """
@@ -20,6 +24,13 @@ class DsmToDomWithMatching:
         self.config = config
         self.logger = logging.getLogger(__name__)
 
+        # 识别坐标（coordinates/*.txt）所在的坐标系，与坐标处理的目标坐标系一致
+        self.coordinate_crs = config.get('coordinates', {}).get('target_crs', 'EPSG:4326')
+
+        # 是否导出整幅DSM的逐像素坐标CSV（a.csv），标注本身不需要
+        self.export_dsm_csv = config.get('export_dsm_csv', False)
+        self.csv_block_rows = config.get('csv_block_rows', 256)
+
         # 创建输出目录
         self.coordinate_output_dir = os.path.join(config['output_dir'], 'dsm_coordinates')
         os.makedirs(self.coordinate_output_dir, exist_ok=True)
@@ -29,73 +40,125 @@ class DsmToDomWithMatching:
 
         self.logger.info("初始化完成，输出目录已创建。")
 
-    def extract_coordinates_from_dsm(self, dsm_path: str):
+    def extract_coordinates_from_dsm(self, dsm_path: str) -> str:
         """
         从DSM图像中提取经纬度和高程信息并保存为CSV文件
+        按行块窗口读取，坐标网格由仿射变换向量化计算，内存占用与图像大小无关
         @param dsm_path: DSM图像路径
+        @return: CSV文件路径
         """
         self.logger.info(f"开始从DSM图像提取坐标: {dsm_path}")
-        coordinates = []
+        output_file = os.path.join(self.coordinate_output_dir, 'a.csv')
+
         with rasterio.open(dsm_path) as src:
-            transform = src.transform
             width = src.width
             height = src.height
             self.logger.info(f"图像宽度: {width}, 高度: {height}")
 
-            for y in range(height):
-                for x in range(width):
-                    # 计算经纬度
-                    lon, lat = transform * (x, y)
-                    elevation = src.read(1)[y, x]  # 假设高程数据在第一波段
-                    coordinates.append({'row': y, 'col': x, 'longitude': lon, 'latitude': lat, 'elevation': elevation})
-
-        # 保存为CSV文件
-        output_file = os.path.join(self.coordinate_output_dir, 'a.csv')
-        df = pd.DataFrame(coordinates)
-        df.to_csv(output_file, index=False)
+            with open(output_file, 'w', newline='') as f:
+                f.write('row,col,longitude,latitude,elevation\n')
+                for top in range(0, height, self.csv_block_rows):
+                    window = Window(0, top, width, min(self.csv_block_rows, height - top))
+                    elevation = src.read(1, window=window)  # 假设高程数据在第一波段
+                    lon, lat = tile_coordinate_grid(src.window_transform(window), *elevation.shape)
+                    rows, cols = np.mgrid[top:top + elevation.shape[0], 0:width]
+                    pd.DataFrame({
+                        'row': rows.ravel(),
+                        'col': cols.ravel(),
+                        'longitude': lon.ravel(),
+                        'latitude': lat.ravel(),
+                        'elevation': elevation.ravel()
+                    }).to_csv(f, header=False, index=False)
 
         self.logger.info(f'坐标结果已保存到: {output_file}')
-        return coordinates
+        return output_file
 
-    def load_txt_coordinates(self, txt_dir: str) -> List[Dict]:
+    def load_txt_coordinates(self, txt_dir: str) -> np.ndarray:
         """
         从TXT文件中加载经纬度信息
         @param txt_dir: TXT文件目录
-        @return: 匹配的坐标列表
+        @return: (N, 2) 数组，列为 经度, 纬度
         """
         self.logger.info(f"开始加载TXT文件中的坐标: {txt_dir}")
-        matched_coords = []
+        chunks = []
         for txt_file in os.listdir(txt_dir):
             if txt_file.endswith('.txt'):
                 self.logger.info(f"处理文件: {txt_file}")
-                with open(os.path.join(txt_dir, txt_file), 'r') as f:
-                    for line in f:
-                        lon, lat, _ = map(float, line.split())
-                        matched_coords.append({'longitude': lon, 'latitude': lat})
+                data = np.loadtxt(os.path.join(txt_dir, txt_file), dtype=np.float64, ndmin=2)
+                if data.size:
+                    chunks.append(data[:, :2])
+        matched_coords = np.concatenate(chunks) if chunks else np.zeros((0, 2))
         self.logger.info(f"加载到的坐标数量: {len(matched_coords)}")
         return matched_coords
 
-    def annotate_dom_with_coordinates(self, dom_path: str, matched_coords: List[Dict], a_coords: pd.DataFrame):
+    def coords_to_pixels(self, src, coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        通过逆仿射变换将经纬度映射到栅格像素（不需要逐像素的坐标表）
+        @param src: 已打开的 rasterio 数据集
+        @param coords: (N, 2) 数组，列为 经度, 纬度（coordinate_crs）
+        @return: (行号数组, 列号数组, 是否落在栅格内的布尔数组)
+        """
+        xs, ys = coords[:, 0], coords[:, 1]
+        if src.crs and src.crs.to_string() != self.coordinate_crs:
+            transformer = Transformer.from_crs(self.coordinate_crs, src.crs, always_xy=True)
+            xs, ys = transformer.transform(xs, ys)
+
+        cols, rows = pixel_to_coords(~src.transform, ys, xs)
+        rows = np.floor(rows).astype(np.int64)
+        cols = np.floor(cols).astype(np.int64)
+        valid = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+        return rows, cols, valid
+
+    def match_coordinates(self, dsm_path: str, coords: np.ndarray) -> pd.DataFrame:
+        """
+        将识别坐标匹配到DSM像素并读取高程：只读取覆盖所有点的一个窗口
+        @param dsm_path: DSM图像路径
+        @param coords: (N, 2) 数组，列为 经度, 纬度
+        @return: DataFrame，列为 longitude, latitude, row, col, elevation（只包含落在DSM内的点）
+        """
+        with rasterio.open(dsm_path) as src:
+            rows, cols, valid = self.coords_to_pixels(src, coords)
+            rows, cols, coords = rows[valid], cols[valid], coords[valid]
+            if not len(rows):
+                return pd.DataFrame(columns=['longitude', 'latitude', 'row', 'col', 'elevation'])
+
+            top, left = rows.min(), cols.min()
+            window = Window(left, top, cols.max() - left + 1, rows.max() - top + 1)
+            elevation = src.read(1, window=window)[rows - top, cols - left]
+
+        self.logger.info(f"匹配到DSM范围内的坐标数量: {len(rows)}/{len(valid)}")
+        return pd.DataFrame({
+            'longitude': coords[:, 0],
+            'latitude': coords[:, 1],
+            'row': rows,
+            'col': cols,
+            'elevation': elevation
+        })
+
+    def annotate_dom_with_coordinates(self, dom_path: str, matched: pd.DataFrame):
         """
         在DOM图像上标注匹配的经纬度
+        DOM 为带地理参考的 GeoTIFF 时按 DOM 自身的仿射变换定位，否则沿用 DSM 的像素位置
         @param dom_path: DOM图像路径
-        @param matched_coords: 匹配的坐标列表
-        @param a_coords: 从a.csv加载的坐标数据
+        @param matched: match_coordinates 的结果
         """
         self.logger.info(f"开始在DOM图像上标注坐标: {dom_path}")
+        pixel_x, pixel_y = matched['col'].to_numpy(), matched['row'].to_numpy()
+        try:
+            with rasterio.open(dom_path) as dom_src:
+                if dom_src.crs and not dom_src.transform.is_identity:
+                    coords = matched[['longitude', 'latitude']].to_numpy()
+                    pixel_y, pixel_x, _ = self.coords_to_pixels(dom_src, coords)
+        except rasterio.errors.RasterioIOError:
+            pass
+
         with Image.open(dom_path) as img:
             draw = ImageDraw.Draw(img)
             font = ImageFont.load_default()  # 使用默认字体
 
-            for match in matched_coords:
-                # 查找匹配的经纬度
-                matched_row = a_coords[(a_coords['longitude'] == match['longitude']) & (a_coords['latitude'] == match['latitude'])]
-                if not matched_row.empty:
-                    pixel_x = matched_row['col'].values[0]
-                    pixel_y = matched_row['row'].values[0]
-
-                    # 在图像上标注经纬度
-                    draw.text((pixel_x, pixel_y), f"({match['longitude']:.2f}, {match['latitude']:.2f})", fill="red", font=font)
+            for x, y, lon, lat in zip(pixel_x, pixel_y, matched['longitude'], matched['latitude']):
+                # 在图像上标注经纬度
+                draw.text((int(x), int(y)), f"({lon:.2f}, {lat:.2f})", fill="red", font=font)
 
             # 保存标注后的图像
             output_path = os.path.join(self.annotated_output_dir, os.path.splitext(os.path.basename(dom_path))[0] + '_annotated.png')
@@ -111,16 +174,17 @@ class DsmToDomWithMatching:
         """
         try:
             self.logger.info("开始处理图像...")
-            # 提取经纬度并保存为CSV
-            a_coords = self.extract_coordinates_from_dsm(dsm_path)
+            # 提取经纬度并保存为CSV（可选）
+            if self.export_dsm_csv:
+                self.extract_coordinates_from_dsm(dsm_path)
 
-            # 加载TXT文件中的经纬度
-            matched_coords = self.load_txt_coordinates(txt_dir)
+            # 加载TXT文件中的经纬度，并匹配到DSM像素
+            matched = self.match_coordinates(dsm_path, self.load_txt_coordinates(txt_dir))
 
             # 将匹配的坐标标注到DOM图像上
-            self.annotate_dom_with_coordinates(dom_path, matched_coords, pd.DataFrame(a_coords))
+            self.annotate_dom_with_coordinates(dom_path, matched)
 
             self.logger.info("所有图像处理完成")
 
         except Exception as e:
-            self.logger.error(f"处理图像时出错: {str(e)}")
\ No newline at end of file
+            self.logger.error(f"处理图像时出错: {str(e)}")
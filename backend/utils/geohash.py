@@ -0,0 +1,48 @@
+# backend/utils/geohash.py
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(longitude: float, latitude: float, precision: int = 11) -> str:
+    """
+    计算经纬度的 geohash（与 MySQL ST_GeoHash 结果一致）
+    精度 10 约为 1.2m x 0.6m，精度 11 约为 0.15m x 0.15m
+    @param longitude: 经度
+    @param latitude: 纬度
+    @param precision: 字符数
+    @return: geohash 字符串
+    """
+    lon_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    chars = []
+    bits, n_bits, even = 0, 0, True
+
+    while len(chars) < precision:
+        # 偶数位二分经度，奇数位二分纬度
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits <<= 1
+            value_range[1] = mid
+        even = not even
+
+        n_bits += 1
+        if n_bits == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits, n_bits = 0, 0
+
+    return ''.join(chars)
+
+
+def stable_tree_id(longitude: float, latitude: float, precision: int = 11) -> str:
+    """
+    由量化后的坐标生成稳定的树木编号：同一棵树重复处理时编号不变，不同切片之间不会冲突
+    @param longitude: 经度
+    @param latitude: 纬度
+    @param precision: geohash 字符数
+    @return: 树木编号，例如 tree_w7w3y2k8qzm
+    """
+    return f"tree_{encode_geohash(longitude, latitude, precision)}"
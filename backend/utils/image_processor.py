@@ -3,9 +3,152 @@ import rasterio
 from rasterio.windows import Window
 import os
 import csv
+import time
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from typing import Dict
 from PIL import Image
+from utils.dsm_tiles import save_dsm_tile
+from utils.run_manifest import fingerprint
+from utils.dsm_alignment import aligned_dataset, match_dom_for_dsm, raster_grid
+from utils.mosaic import build_mosaic_vrt, strips_run_id
+
+def dom_band_indexes(band_count: int):
+    """
+    根据DOM通道数确定需要读取的波段
+    @param band_count: 图像的通道数
+    @return: 波段索引列表（RGB取前3通道，灰度取第1通道）
+    """
+    if band_count >= 3:
+        return [1, 2, 3]  # RGB，只取前3通道防止异常
+    elif band_count == 1:
+        return [1]  # 灰度，稍后转 RGB
+    raise ValueError(f"Unsupported band count: {band_count}")
+
+
+def render_dom_tile(src, indexes, window, tile_buffer: np.ndarray, rgb_buffer: np.ndarray) -> np.ndarray:
+    """
+    读取一个DOM切片窗口并渲染为 tile_size x tile_size 的 RGB 数组，边缘补黑
+    串行与并行切割共用此函数，保证输出字节一致
+    @param src: 已打开的 rasterio 数据集
+    @param indexes: 需要读取的波段索引
+    @param window: 切片窗口
+    @param tile_buffer: 预分配的 (波段数, tile_size, tile_size) 读缓冲区
+    @param rgb_buffer: 预分配的 (tile_size, tile_size, 3) uint8 输出缓冲区
+    @return: rgb_buffer
+    """
+    tile_size = rgb_buffer.shape[0]
+    win_height, win_width = int(window.height), int(window.width)
+
+    if win_height == tile_size and win_width == tile_size:
+        # 完整切片：一次调用读取所有波段，直接写入缓冲区
+        src.read(indexes, window=window, out=tile_buffer)
+    else:
+        # 边缘切片：窗口宽高不足 tile_size，先清零再填充，即补黑
+        tile_buffer.fill(0)
+        tile_buffer[:, :win_height, :win_width] = src.read(indexes, window=window)
+
+    if len(indexes) == 3:
+        np.copyto(rgb_buffer, tile_buffer.transpose(1, 2, 0), casting='unsafe')
+    else:
+        np.copyto(rgb_buffer, tile_buffer[0][:, :, None], casting='unsafe')  # 灰度转 RGB
+    return rgb_buffer
+
+
+def write_dsm_csv_tile(tile_data: np.ndarray, transform, left: int, top: int, tile_csv_path: str):
+    """
+    将一个DSM切片写为逐像素CSV（row, col, longitude, latitude, elevation）
+    @param tile_data: 切片高程数据
+    @param transform: 整幅DSM的仿射变换
+    @param left: 切片左上角列号
+    @param top: 切片左上角行号
+    @param tile_csv_path: 输出CSV路径
+    """
+    with open(tile_csv_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['row', 'col', 'longitude', 'latitude', 'elevation'])
+
+        for row in range(tile_data.shape[0]):
+            for col in range(tile_data.shape[1]):
+                elevation = tile_data[row, col]
+
+                # 计算经纬度
+                x, y = transform * (left + col, top + row)
+
+                writer.writerow([row, col, x, y, elevation])
+
+
+def dom_tile_worker(dom_tif_path: str, output_folder: str, tile_size: int, tiles, prefix: str = 'tile') -> int:
+    """
+    进程池任务：打开独立的 rasterio 句柄，切割并编码一组互不重叠的DOM切片
+    @param dom_tif_path: DOM文件路径
+    @param output_folder: 输出文件夹路径
+    @param tile_size: 切片大小
+    @param tiles: [(i, j, col_off, row_off, width, height), ...]
+    @param prefix: 切片文件名前缀
+    @return: 写出的切片数
+    """
+    with rasterio.open(dom_tif_path) as src:
+        indexes = dom_band_indexes(src.count)
+        tile_buffer = np.zeros((len(indexes), tile_size, tile_size), dtype=src.dtypes[0])
+        rgb_buffer = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+
+        for i, j, col_off, row_off, width, height in tiles:
+            window = Window(col_off, row_off, width, height)
+            img = Image.fromarray(render_dom_tile(src, indexes, window, tile_buffer, rgb_buffer))
+            img.save(os.path.join(output_folder, f'{prefix}_{i}_{j}.png'), 'PNG')
+    return len(tiles)
+
+
+def dsm_tile_worker(dsm_tif_path: str, output_folder: str, tile_size: int, tiles, align_to=None,
+                    prefix: str = 'tile') -> int:
+    """
+    进程池任务：打开独立的 rasterio 句柄，按窗口读取并写出一组DSM切片
+    @param dsm_tif_path: DSM文件路径
+    @param output_folder: 输出文件夹路径
+    @param tile_size: 切片大小
+    @param tiles: [(i, j, col_off, row_off, width, height), ...]
+    @param align_to: 对齐的DOM网格，窗口为DOM像素窗口，为 None 时使用DSM自身网格
+    @param prefix: 切片文件名前缀
+    @return: 写出的切片数
+    """
+    with rasterio.open(dsm_tif_path) as src, aligned_dataset(src, align_to) as dsm:
+        transform = dsm.transform
+        for i, j, col_off, row_off, width, height in tiles:
+            tile_data = dsm.read(1, window=Window(col_off, row_off, width, height), out_dtype=np.float32)
+            # CSV 不记录无效值，无效像素（包括对齐后超出DSM覆盖范围的像素）写为 NaN，坐标处理时被丢弃
+            if dsm.nodata is not None:
+                tile_data[tile_data == dsm.nodata] = np.nan
+            tile_csv_path = os.path.join(output_folder, f'{prefix}_{i}_{j}.csv')
+            write_dsm_csv_tile(tile_data, transform, col_off, row_off, tile_csv_path)
+    return len(tiles)
+
+
+def dsm_npy_tile_worker(dsm_tif_path: str, output_folder: str, tile_size: int, tiles, align_to=None,
+                        prefix: str = 'tile') -> int:
+    """
+    进程池任务：按窗口读取DSM切片并保存为 float32 .npy + 仿射变换说明文件
+    @param dsm_tif_path: DSM文件路径
+    @param output_folder: 输出文件夹路径
+    @param tile_size: 切片大小
+    @param tiles: [(i, j, col_off, row_off, width, height), ...]
+    @param align_to: 对齐的DOM网格，窗口为DOM像素窗口，为 None 时使用DSM自身网格
+    @param prefix: 切片文件名前缀
+    @return: 写出的切片数
+    """
+    with rasterio.open(dsm_tif_path) as src, aligned_dataset(src, align_to) as dsm:
+        crs = dsm.crs.to_string() if dsm.crs else None
+        for i, j, col_off, row_off, width, height in tiles:
+            window = Window(col_off, row_off, width, height)
+            save_dsm_tile(
+                dsm.read(1, window=window, out_dtype=np.float32),
+                dsm.window_transform(window),
+                os.path.join(output_folder, f'{prefix}_{i}_{j}.npy'),
+                crs=crs,
+                nodata=dsm.nodata
+            )
+    return len(tiles)
 
 
 class ImageProcessor:
@@ -21,6 +164,28 @@ class ImageProcessor:
         self.config = config
         self.tile_size = 640  # 固定切片大小为640*640
 
+        # 并行切割配置：num_workers <= 1 时串行处理
+        tiling_config = config.get('tiling', {})
+        self.num_workers = tiling_config.get('num_workers', 0)
+        self.chunk_size = tiling_config.get('chunk_size', 64)
+
+        # 是否写出DOM切片PNG，检测使用流式模式时可关闭
+        self.write_dom_tiles = tiling_config.get('write_dom_tiles', True)
+
+        # DSM切片输出格式：'csv' 逐像素文本，'npy' 二进制高程数组 + 仿射变换说明文件
+        self.dsm_format = tiling_config.get('dsm_format', 'csv')
+        if self.dsm_format not in ('csv', 'npy'):
+            raise ValueError(f"Unsupported DSM tile format: {self.dsm_format}")
+
+        # DSM对齐：DSM与DOM网格不同（例如分辨率更低）时，按DOM像素窗口经 WarpedVRT 重采样读取
+        self.align_dsm_to_dom = tiling_config.get('align_dsm_to_dom', True)
+        self.dsm_resampling = tiling_config.get('dsm_resampling', 'bilinear')
+        self.dsm_warp_mem_limit = tiling_config.get('dsm_warp_mem_limit', 64)
+
+        # 镶嵌模式：多个条带组成一个虚拟镶嵌，在并集范围上统一切割，切片名带运行编号，不会互相覆盖
+        self.mosaic = tiling_config.get('mosaic', False)
+        self.tile_prefix = 'tile'  # 切片名前缀，镶嵌模式下为 tile_<运行编号>
+
         # 设置日志
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -28,6 +193,20 @@ class ImageProcessor:
         # 创建输入输出目录
         self.create_directories()
 
+        # 进度回调（后台任务使用），参数为本次完成的数量
+        self.progress_callback = config.get('progress_callback')
+
+        # 运行清单（RunManifest），为 None 时每次全部重新切割
+        self.manifest = config.get('manifest')
+
+    def report_progress(self, n: int = 1):
+        """
+        上报进度（后台任务通过 config['progress_callback'] 传入回调）
+        @param n: 本次完成的数量
+        """
+        if self.progress_callback:
+            self.progress_callback(n)
+
     def create_directories(self):
         """创建必要的目录结构"""
         # 输入目录
@@ -37,6 +216,7 @@ class ImageProcessor:
         os.makedirs(self.dsm_input_dir, exist_ok=True)
 
         # 输出目录
+        self.mosaic_dir = os.path.join(self.config['output_dir'], 'mosaic')
         self.dom_output_dir = os.path.join(self.config['output_dir'], 'dom_tiles')
         self.dsm_output_dir = os.path.join(self.config['output_dir'], 'dsm_tiles')
         os.makedirs(self.dom_output_dir, exist_ok=True)
@@ -152,128 +332,323 @@ class ImageProcessor:
     #                 img.save(tile_path, 'PNG')
     #
     #                 self.logger.info(f"Generate PNG: {tile_path}")
-    def split_tif(self, dom_tif_path: str, output_folder: str):
+    def tile_name(self, i: int, j: int) -> str:
         """
-        将 DOM TIFF 文件切割为 640x640 的图像，边缘补黑，不丢块
+        切片名称（不含扩展名），同时作为运行清单中的切片键
+        @param i: 列号
+        @param j: 行号
+        @return: 例如 tile_3_5，镶嵌模式下为 tile_<运行编号>_3_5
         """
-        with rasterio.open(dom_tif_path) as src:
-            bands = src.count
-            height = src.height
-            width = src.width
+        return f'{self.tile_prefix}_{i}_{j}'
 
-            n_tiles_x = (width + self.tile_size - 1) // self.tile_size
-            n_tiles_y = (height + self.tile_size - 1) // self.tile_size
-
-            for i in range(n_tiles_x):
-                for j in range(n_tiles_y):
-                    left = i * self.tile_size
-                    top = j * self.tile_size
-
-                    # 窗口宽高最多为 tile_size，边缘可能不足
-                    win_width = min(self.tile_size, width - left)
-                    win_height = min(self.tile_size, height - top)
-
-                    window = Window(left, top, win_width, win_height)
-
-                    # 读取窗口数据
-                    tile_data = np.zeros((bands, self.tile_size, self.tile_size), dtype=np.uint8)
-                    for b in range(bands):
-                        band_data = src.read(b + 1, window=window)
-
-                        # 填充到完整 tile 中
-                        tile_data[b, :win_height, :win_width] = band_data
-
-                    # # 转换为 RGB 格式
-                    # rgb_data = np.transpose(tile_data[:3], (1, 2, 0))  # 只取前3通道防止异常
-                    # img = Image.fromarray(rgb_data)
-                    bands, h, w = tile_data.shape
-
-                    # 判断通道数并处理
-                    if bands >= 3:
-                        rgb_data = np.transpose(tile_data[:3], (1, 2, 0))  # RGB
-                    elif bands == 1:
-                        gray = tile_data[0]
-                        rgb_data = np.stack([gray] * 3, axis=-1)  # 灰度转 RGB
-                    else:
-                        raise ValueError(f"Unsupported band count: {bands}")
-
-                    # 构建图像
-                    img = Image.fromarray(rgb_data)
-
-                    tile_filename = f'tile_{i}_{j}.png'
-                    tile_path = os.path.join(output_folder, tile_filename)
-                    img.save(tile_path, 'PNG')
-                    self.logger.info(f"✅ Generate tile: {tile_path} ({img.size})")
-
-    def split_tif_and_generate_csv(self, dsm_tif_path: str, output_folder: str):
-        """
-        将DSM TIFF文件分割为小块并生成对应的CSV文件
-        @param dsm_tif_path: DSM文件路径
-        @param output_folder: 输出文件夹路径
+    def input_rasters(self):
         """
-        with rasterio.open(dsm_tif_path) as src:
-            # 获取数据
-            dsm_data = src.read(1)  # 读取高程数据
-            transform = src.transform
-
-            width = src.width
-            height = src.height
-
-            # 计算分块数量
-            n_tiles_x = (width + self.tile_size - 1) // self.tile_size
-            n_tiles_y = (height + self.tile_size - 1) // self.tile_size
-
+        列出待处理的DOM和DSM栅格
+        镶嵌模式下将所有条带组合为虚拟镶嵌（VRT，只记录各条带的位置，不复制像素），
+        并按输入条带计算运行编号作为切片名前缀
+        @return: (DOM路径列表, DSM路径列表)
+        """
+        dom_paths = [
+            os.path.join(self.dom_input_dir, f) for f in sorted(os.listdir(self.dom_input_dir)) if f.endswith('.tif')
+        ]
+        dsm_paths = [
+            os.path.join(self.dsm_input_dir, f) for f in sorted(os.listdir(self.dsm_input_dir)) if f.endswith('.tif')
+        ]
+
+        if not self.mosaic:
+            if len(dom_paths) > 1 or len(dsm_paths) > 1:
+                self.logger.warning("存在多个DOM/DSM条带，切片名会互相覆盖，建议开启 tiling.mosaic 镶嵌模式")
+            return dom_paths, dsm_paths
+
+        run_id = strips_run_id(dom_paths + dsm_paths)
+        self.tile_prefix = f'tile_{run_id}'
+        if len(dom_paths) > 1:
+            dom_paths = [build_mosaic_vrt(dom_paths, os.path.join(self.mosaic_dir, f'dom_{run_id}.vrt'))]
+        if len(dsm_paths) > 1:
+            dsm_paths = [build_mosaic_vrt(dsm_paths, os.path.join(self.mosaic_dir, f'dsm_{run_id}.vrt'))]
+        self.logger.info(f"Mosaic mode: run {run_id}, DOM {dom_paths}, DSM {dsm_paths}")
+        return dom_paths, dsm_paths
+
+    def iter_tile_windows(self, src):
+        """
+        按栅格内部块布局的顺序生成切片窗口
+        @param src: 已打开的 rasterio 数据集
+        @return: 生成器，依次产出 (i, j, window)，i 为列号，j 为行号
+        """
+        block_height, block_width = src.block_shapes[0]
+
+        if block_height == self.tile_size and block_width == self.tile_size:
+            # 内部块与切片大小一致时直接按块遍历，每个切片恰好对应一个块
+            for (row, col), window in src.block_windows(1):
+                yield col, row, window
+            return
+
+        # 否则按行优先顺序遍历切片网格（与 GeoTIFF 块/条带的存储顺序一致），
+        # 相邻切片读取命中同一批块，GDAL 块缓存可以复用
+        n_tiles_x = (src.width + self.tile_size - 1) // self.tile_size
+        n_tiles_y = (src.height + self.tile_size - 1) // self.tile_size
+        for j in range(n_tiles_y):
+            top = j * self.tile_size
+            win_height = min(self.tile_size, src.height - top)
             for i in range(n_tiles_x):
-                for j in range(n_tiles_y):
-                    # 计算分块范围
-                    left = i * self.tile_size
-                    top = j * self.tile_size
-                    right = min(left + self.tile_size, width)
-                    bottom = min(top + self.tile_size, height)
+                left = i * self.tile_size
+                win_width = min(self.tile_size, src.width - left)
+                yield i, j, Window(left, top, win_width, win_height)
 
-                    # 提取分块数据
-                    tile_data = dsm_data[top:bottom, left:right]
+    def iter_dom_tiles(self, dom_tif_path: str, tiles=None):
+        """
+        以窗口方式读取DOM，逐个产出内存中的切片，不写中间PNG
+        @param dom_tif_path: DOM文件路径
+        @param tiles: 只读取这些切片 [(i, j, col_off, row_off, width, height), ...]，默认读取全部
+        @return: 生成器，依次产出 ((i, j), RGB 数组, 切片仿射变换)
+        """
+        with rasterio.open(dom_tif_path) as src:
+            if tiles is None:
+                windows = (((i, j), window) for i, j, window in self.iter_tile_windows(src))
+            else:
+                windows = (((i, j), Window(col_off, row_off, width, height))
+                           for i, j, col_off, row_off, width, height in tiles)
+            yield from self._render_windows(src, windows)
+
+    def iter_dom_windows(self, dom_tif_path: str, windows):
+        """
+        按任意（可重叠的）窗口读取DOM切片，超出图像范围的部分补黑
+        @param dom_tif_path: DOM文件路径
+        @param windows: (N, 4) 窗口数组，每行为 x1, y1, x2, y2（像素）
+        @return: 生成器，依次产出 ((x1, y1), RGB 数组, 切片仿射变换)
+        """
+        with rasterio.open(dom_tif_path) as src:
+            tiles = (
+                ((int(x1), int(y1)), Window(int(x1), int(y1), min(int(x2), src.width) - int(x1),
+                                            min(int(y2), src.height) - int(y1)))
+                for x1, y1, x2, y2 in windows
+            )
+            yield from self._render_windows(src, tiles)
+
+    def _render_windows(self, src, tiles):
+        """
+        渲染一组窗口为独立的RGB数组
+        @param src: 已打开的 rasterio 数据集
+        @param tiles: 可迭代对象，产出 (切片键, window)
+        @return: 生成器，依次产出 (切片键, RGB 数组, 切片仿射变换)
+        """
+        indexes = dom_band_indexes(src.count)
+        tile_buffer = np.zeros((len(indexes), self.tile_size, self.tile_size), dtype=src.dtypes[0])
+        rgb_buffer = np.zeros((self.tile_size, self.tile_size, 3), dtype=np.uint8)
 
-                    # 保存分块CSV文件
-                    tile_filename = f'tile_{i}_{j}.csv'
-                    tile_csv_path = os.path.join(output_folder, tile_filename)
+        for key, window in tiles:
+            # 产出副本，调用方可能将切片放入队列，缓冲区会被下一个切片覆盖
+            rgb = render_dom_tile(src, indexes, window, tile_buffer, rgb_buffer).copy()
+            yield key, rgb, src.window_transform(window)
 
-                    with open(tile_csv_path, 'w', newline='') as csvfile:
-                        writer = csv.writer(csvfile)
-                        writer.writerow(['row', 'col', 'longitude', 'latitude', 'elevation'])
+    def report_tiling_stats(self, kind: str, tif_path: str, n_tiles: int, elapsed: float) -> Dict:
+        """
+        记录并返回切割吞吐统计
+        @param kind: 'DOM' 或 'DSM'
+        @param tif_path: 源文件路径
+        @param n_tiles: 切片数
+        @param elapsed: 耗时（秒）
+        @return: {'tiles': 切片数, 'seconds': 耗时, 'tiles_per_sec': 吞吐}
+        """
+        stats = {
+            'tiles': n_tiles,
+            'seconds': elapsed,
+            'tiles_per_sec': n_tiles / elapsed if elapsed > 0 else 0.0
+        }
+        self.logger.info(
+            f"✅ {kind} tiling finished: {tif_path} -> {n_tiles} tiles "
+            f"in {elapsed:.2f}s ({stats['tiles_per_sec']:.1f} tiles/s)"
+        )
+        return stats
+
+    def list_tiles(self, tif_path: str):
+        """
+        列出栅格的全部切片窗口
+        @param tif_path: TIFF文件路径
+        @return: [(i, j, col_off, row_off, width, height), ...]
+        """
+        with rasterio.open(tif_path) as src:
+            return [
+                (i, j, int(window.col_off), int(window.row_off), int(window.width), int(window.height))
+                for i, j, window in self.iter_tile_windows(src)
+            ]
 
-                        for row in range(tile_data.shape[0]):
-                            for col in range(tile_data.shape[1]):
-                                elevation = tile_data[row, col]
+    def tile_chunks(self, tif_path: str, tiles=None):
+        """
+        将栅格的切片窗口划分为互不重叠的任务块，供进程池使用
+        @param tif_path: TIFF文件路径
+        @param tiles: 待切割的切片列表，默认为全部切片
+        @return: [[(i, j, col_off, row_off, width, height), ...], ...]
+        """
+        if tiles is None:
+            tiles = self.list_tiles(tif_path)
+        return [tiles[k:k + self.chunk_size] for k in range(0, len(tiles), self.chunk_size)]
 
-                                # 计算经纬度
-                                x, y = transform * (left + col, top + row)
+    def tile_input_hashes(self, tif_path: str, tiles, ext: str, *params) -> Dict:
+        """
+        计算每个切片的输入指纹：源文件内容 + 窗口 + 切片格式
+        检测阶段（流式）使用同一指纹，与切片PNG的指纹一致
+        @param tif_path: TIFF文件路径
+        @param tiles: [(i, j, col_off, row_off, width, height), ...]
+        @param ext: 输出格式扩展名
+        @param params: 其他影响切片内容的参数（例如DSM对齐的目标网格）
+        @return: {切片键: 输入指纹}
+        """
+        file_hash = self.manifest.file_hash(tif_path)
+        return {
+            self.tile_name(i, j): fingerprint(file_hash, col_off, row_off, width, height, self.tile_size, ext, *params)
+            for i, j, col_off, row_off, width, height in tiles
+        }
 
-                                writer.writerow([row, col, x, y, elevation])
+    def dsm_alignment(self, dsm_path: str, dom_paths):
+        """
+        确定DSM对齐的目标DOM网格
+        @param dsm_path: DSM文件路径
+        @param dom_paths: DOM文件路径列表
+        @return: (DOM路径, 对齐参数)，不需要对齐时返回 (None, None)
+        """
+        if not self.align_dsm_to_dom:
+            return None, None
+        dom_path = match_dom_for_dsm(dsm_path, dom_paths)
+        if dom_path is None:
+            if dom_paths:
+                self.logger.warning(f"无法确定DSM {os.path.basename(dsm_path)} 对应的DOM，按DSM自身网格切割")
+            return None, None
+
+        align_to = raster_grid(dom_path)
+        if align_to == raster_grid(dsm_path):
+            return None, None
+        align_to.update(resampling=self.dsm_resampling, warp_mem_limit=self.dsm_warp_mem_limit)
+        self.logger.info(
+            f"DSM {os.path.basename(dsm_path)} is aligned to the grid of DOM {os.path.basename(dom_path)} "
+            f"({align_to['width']}x{align_to['height']}, {self.dsm_resampling} resampling)"
+        )
+        return dom_path, align_to
+
+    def plan_tiles(self, stage: str, tif_path: str, output_folder: str, ext: str, grid_path=None, align_to=None):
+        """
+        根据运行清单确定需要切割的切片：输入指纹变化、阶段未完成或输出文件缺失
+        @param stage: 阶段名称（'dom_tiles' 或 'dsm_tiles'）
+        @param tif_path: TIFF文件路径
+        @param output_folder: 输出文件夹路径
+        @param ext: 输出格式扩展名
+        @param grid_path: 决定切片窗口的栅格（DSM对齐时为DOM），默认为 tif_path
+        @param align_to: DSM对齐的目标网格
+        @return: (待切割的切片列表, {切片键: 输入指纹})，未启用清单时返回全部切片和空字典
+        """
+        tiles = self.list_tiles(grid_path or tif_path)
+        if self.manifest is None:
+            return tiles, {}
+
+        params = (sorted(align_to.items()),) if align_to else ()
+        if align_to and ext == '.csv':
+            # 对齐后的CSV切片无效像素改写为 NaN，旧切片（写为 -9999）需要重新切割
+            params += ('nan_nodata',)
+        hashes = self.tile_input_hashes(tif_path, tiles, ext, *params)
+        self.manifest.record_tiles(stage, tif_path, [(self.tile_name(t[0], t[1]), *t[2:]) for t in tiles])
+        pending = set(self.manifest.pending(stage, hashes))
+        todo = [
+            t for t in tiles
+            if self.tile_name(t[0], t[1]) in pending
+            or not os.path.exists(os.path.join(output_folder, f'{self.tile_name(t[0], t[1])}{ext}'))
+        ]
+        self.logger.info(f"{os.path.basename(tif_path)}: {len(todo)}/{len(tiles)} tiles need slicing")
+        return todo, hashes
+
+    def mark_tiles_done(self, stage: str, chunk, hashes: Dict):
+        """
+        在运行清单中记录一个任务块已完成
+        @param stage: 阶段名称
+        @param chunk: 已完成的切片列表
+        @param hashes: {切片键: 输入指纹}
+        """
+        if self.manifest is not None:
+            keys = [self.tile_name(i, j) for i, j, *_ in chunk]
+            self.manifest.mark_done(stage, [(key, hashes[key]) for key in keys])
 
-                    self.logger.info(f"Generate CSV: {tile_csv_path}")
+    def split_tif_parallel(self, executor: ProcessPoolExecutor, worker, tif_path: str, output_folder: str,
+                           tiles=None):
+        """
+        将切片任务块提交到进程池，每个进程打开自己的 rasterio 句柄
+        @param executor: 进程池
+        @param worker: dom_tile_worker、dsm_tile_worker 或 dsm_npy_tile_worker
+        @param tif_path: TIFF文件路径
+        @param output_folder: 输出文件夹路径
+        @param tiles: 待切割的切片列表，默认为全部切片
+        @return: [(任务块, Future), ...]，Future 的结果为该任务块写出的切片数
+        """
+        return [
+            (chunk, executor.submit(worker, tif_path, output_folder, self.tile_size, chunk))
+            for chunk in self.tile_chunks(tif_path, tiles)
+        ]
+
+    def tiling_tasks(self):
+        """
+        列出第一步的切割任务
+        DSM与DOM网格不同时，DSM按DOM的切片窗口切割，保证 tile_i_j 的DOM与DSM切片覆盖相同像素
+        @return: [(类型, 阶段名称, TIFF路径, 切片任务函数, 输出文件夹, 输出扩展名, 窗口栅格, 对齐参数), ...]
+        """
+        dom_paths, dsm_paths = self.input_rasters()
+        tasks = []
+        if self.write_dom_tiles:
+            for dom_path in dom_paths:
+                tasks.append(('DOM', 'dom_tiles', dom_path, partial(dom_tile_worker, prefix=self.tile_prefix),
+                              self.dom_output_dir, '.png', None, None))
+
+        dsm_worker = dsm_npy_tile_worker if self.dsm_format == 'npy' else dsm_tile_worker
+        for dsm_path in dsm_paths:
+            grid_path, align_to = self.dsm_alignment(dsm_path, dom_paths)
+            tasks.append(('DSM', 'dsm_tiles', dsm_path, partial(dsm_worker, align_to=align_to, prefix=self.tile_prefix),
+                          self.dsm_output_dir, f'.{self.dsm_format}', grid_path, align_to))
+        return tasks
 
     def process_first_step(self):
         """
-        执行第一步处理：切割DOM为PNG，切割DSM并生成CSV
+        执行第一步处理：切割DOM为PNG，切割DSM并生成CSV（或 .npy 高程切片）
+        按任务块切割，每完成一块在运行清单中记录一次；已完成且输入未变化的切片直接跳过
         """
         try:
-            # 处理DOM图像
-            for dom_file in os.listdir(self.dom_input_dir):
-                if dom_file.endswith('.tif'):
-                    dom_path = os.path.join(self.dom_input_dir, dom_file)
-                    self.logger.info(f"Start processing DOM file: {dom_file}")
-                    self.split_tif(dom_path, self.dom_output_dir)
-
-            # 处理DSM图像
-            for dsm_file in os.listdir(self.dsm_input_dir):
-                if dsm_file.endswith('.tif'):
-                    dsm_path = os.path.join(self.dsm_input_dir, dsm_file)
-                    self.logger.info(f"Start processing DSM file: {dsm_file}")
-                    self.split_tif_and_generate_csv(dsm_path, self.dsm_output_dir)
+            plans = []
+            for kind, stage, tif_path, worker, output_folder, ext, grid_path, align_to in self.tiling_tasks():
+                self.logger.info(f"Start processing {kind} file: {os.path.basename(tif_path)}")
+                tiles, hashes = self.plan_tiles(stage, tif_path, output_folder, ext, grid_path, align_to)
+                plans.append((kind, stage, tif_path, worker, output_folder, tiles, hashes))
+
+            if self.num_workers > 1:
+                self.process_first_step_parallel(plans)
+            else:
+                for kind, stage, tif_path, worker, output_folder, tiles, hashes in plans:
+                    start_time = time.perf_counter()
+                    for chunk in self.tile_chunks(tif_path, tiles):
+                        worker(tif_path, output_folder, self.tile_size, chunk)
+                        self.mark_tiles_done(stage, chunk, hashes)
+                        self.report_progress(len(chunk))
+                    self.report_tiling_stats(kind, tif_path, len(tiles), time.perf_counter() - start_time)
 
             self.logger.info("Step 1 completed: DOM and DSM image slicing finished")
 
         except Exception as e:
             self.logger.error(f"第一步处理出错: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def process_first_step_parallel(self, plans):
+        """
+        并行执行第一步：DOM与DSM的切片任务块共用一个进程池同时处理
+        @param plans: [(类型, 阶段名称, TIFF路径, 切片任务函数, 输出文件夹, 待切割切片, 输入指纹), ...]
+        """
+        self.logger.info(f"Start parallel slicing with {self.num_workers} workers (chunk size {self.chunk_size})")
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            jobs = [
+                (kind, stage, tif_path, hashes, time.perf_counter(),
+                 self.split_tif_parallel(executor, worker, tif_path, output_folder, tiles))
+                for kind, stage, tif_path, worker, output_folder, tiles, hashes in plans
+            ]
+
+            for kind, stage, tif_path, hashes, start_time, futures in jobs:
+                n_tiles = 0
+                for chunk, future in futures:
+                    n_chunk = future.result()
+                    n_tiles += n_chunk
+                    self.mark_tiles_done(stage, chunk, hashes)
+                    self.report_progress(n_chunk)
+                self.report_tiling_stats(kind, tif_path, n_tiles, time.perf_counter() - start_time)
@@ -0,0 +1,191 @@
+# backend/utils/job_manager.py
+
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
+
+class Job:
+    """
+    后台任务：按顺序执行若干处理阶段，并记录进度
+    """
+
+    def __init__(self, stages: List[str]):
+        """
+        初始化任务
+        @param stages: 阶段名称列表
+        """
+        self.id = uuid.uuid4().hex
+        self.stages = stages
+        self.status = 'queued'  # queued / waiting_for_pipeline / running / completed / failed
+        self.stage = None
+        self.stage_index = 0
+        self.items_done = 0  # 当前阶段已完成的数量（切片、文件或数据行）
+        self.stage_started_at = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.stage_times = {}
+        self.error = None
+        self._lock = threading.Lock()
+
+    def set_status(self, status: str, error: str = None):
+        """
+        更新任务状态，任务结束（completed / failed）时记录结束时间
+        @param status: 新状态
+        @param error: 失败原因
+        """
+        with self._lock:
+            self.status = status
+            if error is not None:
+                self.error = error
+            if status in ('completed', 'failed'):
+                self.finished_at = time.time()
+
+    def start_stage(self, index: int, stage: str):
+        """进入新阶段并重置进度"""
+        with self._lock:
+            self.stage_index = index
+            self.stage = stage
+            self.items_done = 0
+            self.stage_started_at = time.time()
+
+    def finish_stage(self):
+        """记录当前阶段耗时"""
+        with self._lock:
+            self.stage_times[self.stage] = time.time() - self.stage_started_at
+
+    def add_progress(self, n: int = 1):
+        """
+        进度回调，由各处理器调用
+        @param n: 本次完成的数量
+        """
+        with self._lock:
+            self.items_done += n
+
+    def to_dict(self) -> Dict:
+        """任务状态（供 /api/jobs/<id> 返回）"""
+        with self._lock:
+            elapsed = time.time() - self.stage_started_at if self.stage_started_at else 0.0
+            return {
+                'id': self.id,
+                'status': self.status,
+                'stages': self.stages,
+                'stage': self.stage,
+                'stage_index': self.stage_index,
+                'tiles_done': self.items_done,
+                'throughput': self.items_done / elapsed if elapsed > 0 and self.status == 'running' else None,
+                'stage_times': dict(self.stage_times),
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+                'error': self.error
+            }
+
+
+class JobManager:
+    """
+    任务管理器：使用线程池在后台执行处理流水线
+    包含独占阶段的任务共享同一套输入/输出目录（切片、检测结果、坐标、运行清单），
+    整个任务持有流水线锁依次执行；等待流水线锁（例如同步接口正在执行）期间状态为 waiting_for_pipeline
+    任务状态由管理器在自身的锁内更新，清理已结束任务时不会读到不一致的状态
+    """
+
+    def __init__(self, stage_runners: Dict[str, Callable], max_workers: int = 1, max_finished_jobs: int = 100,
+                 exclusive_stages: Iterable[str] = ()):
+        """
+        初始化任务管理器
+        @param stage_runners: 阶段名称 -> 执行函数，函数接收进度回调参数
+        @param max_workers: 同时执行的任务数
+        @param max_finished_jobs: 保留的已结束任务数，超出后清理最早的任务
+        @param exclusive_stages: 读写共享输出目录、不能并发执行的阶段
+        """
+        self.stage_runners = stage_runners
+        self.max_finished_jobs = max_finished_jobs
+        self.exclusive_stages = set(exclusive_stages)
+        # 流水线锁：同步接口（/api/process 等）直接执行阶段时也需持有
+        self.pipeline_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline-job')
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def submit(self, stages: List[str]) -> Job:
+        """
+        提交任务
+        @param stages: 要执行的阶段名称列表，按顺序执行
+        @return: Job 对象
+        """
+        unknown = [stage for stage in stages if stage not in self.stage_runners]
+        if not stages or unknown:
+            raise ValueError(f"Unknown pipeline stages: {unknown or stages}")
+
+        job = Job(stages)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self.executor.submit(self._run, job)
+        self.logger.info(f"Job {job.id} submitted: {' -> '.join(stages)}")
+        return job
+
+    def get(self, job_id: str):
+        """
+        获取任务
+        @param job_id: 任务ID
+        @return: Job 对象，不存在时返回 None
+        """
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        """获取所有任务，按创建时间倒序"""
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def _prune(self):
+        """清理最早结束的任务，避免任务表无限增长"""
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job.id]
+
+    def _set_status(self, job: Job, status: str, error: str = None):
+        """
+        在管理器的锁内更新任务状态
+        @param job: 任务
+        @param status: 新状态
+        @param error: 失败原因
+        """
+        with self._lock:
+            job.set_status(status, error)
+
+    def _run(self, job: Job):
+        """在工作线程中依次执行各阶段"""
+        if self.exclusive_stages.intersection(job.stages):
+            # 流水线锁被占用时（同步接口或其他任务正在执行），在状态中标明正在等待
+            if not self.pipeline_lock.acquire(blocking=False):
+                self._set_status(job, 'waiting_for_pipeline')
+                self.logger.info(f"Job {job.id} waiting for pipeline lock")
+                self.pipeline_lock.acquire()
+            try:
+                self._run_stages(job)
+            finally:
+                self.pipeline_lock.release()
+        else:
+            self._run_stages(job)
+
+    def _run_stages(self, job: Job):
+        """依次执行各阶段并记录状态"""
+        self._set_status(job, 'running')
+        try:
+            for index, stage in enumerate(job.stages):
+                job.start_stage(index, stage)
+                self.logger.info(f"Job {job.id} stage started: {stage}")
+                self.stage_runners[stage](job.add_progress)
+                job.finish_stage()
+            self._set_status(job, 'completed')
+            self.logger.info(f"Job {job.id} completed")
+        except Exception as e:
+            self._set_status(job, 'failed', str(e))
+            self.logger.error(f"任务 {job.id} 在阶段 {job.stage} 出错: {str(e)}")
@@ -0,0 +1,309 @@
+# backend/utils/label_sheet.py
+
+import base64
+import io
+import zipfile
+import zlib
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from utils.db_pool import close_streaming_cursor
+from utils.qrcode_util import generate_qrcode_with_id
+
+A4_MM = (210.0, 297.0)
+
+
+def build_label_query(selection: Dict) -> Tuple[str, List]:
+    """
+    根据筛选条件构造查询（按 id 排序，标签顺序稳定）
+    @param selection: 筛选条件，可包含 bbox (minlon, minlat, maxlon, maxlat)、id_from、id_to、image_name
+    @return: (SQL, 参数列表)
+    """
+    conditions, params = [], []
+    if selection.get('bbox'):
+        conditions.append("MBRContains(ST_MakeEnvelope(POINT(%s, %s), POINT(%s, %s)), location)")
+        params.extend(selection['bbox'])
+    if selection.get('id_from') is not None:
+        conditions.append("id >= %s")
+        params.append(selection['id_from'])
+    if selection.get('id_to') is not None:
+        conditions.append("id <= %s")
+        params.append(selection['id_to'])
+    if selection.get('image_name'):
+        conditions.append("image_name = %s")
+        params.append(selection['image_name'])
+
+    query = "SELECT id, tree_id FROM tree_data"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + " ORDER BY id", params
+
+
+def iter_label_trees(get_connection: Callable, selection: Dict, batch_size: int = 1000) -> Iterator[Tuple[int, str]]:
+    """
+    以非缓冲游标逐批读取待打印的树木，内存占用与选中数量无关
+    @param get_connection: 获取数据库连接的函数
+    @param selection: 筛选条件，见 build_label_query
+    @param batch_size: 每次读取的行数
+    @return: 生成器，依次产出 (id, tree_id)
+    """
+    query, params = build_label_query(selection)
+    connection = get_connection()
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], row[1]
+    finally:
+        # 导出中途停止时结果集可能未读完，先丢弃剩余结果再归还连接
+        close_streaming_cursor(cursor, connection, batch_size)
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """将可迭代对象按固定大小分组"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_label_font(size: int):
+    """加载标签文字字体，系统中没有 TrueType 字体时使用默认字体"""
+    for name in ('DejaVuSans.ttf', 'arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def qrcode_image(tree_db_id: int) -> Image.Image:
+    """生成树木二维码图片（内容与 /api/qrcode/<id> 一致）"""
+    return Image.open(io.BytesIO(base64.b64decode(generate_qrcode_with_id(tree_db_id))))
+
+
+def render_label_page(labels: List[Tuple[int, str]], layout: Dict) -> Tuple[int, int, bytes]:
+    """
+    渲染一页 A4 标签（进程池任务）：每个标签为二维码 + 下方的树木编号
+    @param labels: [(id, tree_id), ...]，数量不超过 columns * rows
+    @param layout: 版式配置（columns, rows, dpi, margin_mm）
+    @return: (宽度像素, 高度像素, zlib 压缩的灰度像素数据)
+    """
+    dpi = layout['dpi']
+    width = int(round(A4_MM[0] / 25.4 * dpi))
+    height = int(round(A4_MM[1] / 25.4 * dpi))
+    margin = int(round(layout['margin_mm'] / 25.4 * dpi))
+    cell_w = (width - 2 * margin) // layout['columns']
+    cell_h = (height - 2 * margin) // layout['rows']
+
+    font = load_label_font(max(10, cell_h // 12))
+    text_h = cell_h // 6
+    qr_size = min(cell_w, cell_h - text_h) * 9 // 10
+
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    for index, (tree_db_id, tree_id) in enumerate(labels):
+        row, col = divmod(index, layout['columns'])
+        x0 = margin + col * cell_w
+        y0 = margin + row * cell_h
+
+        # 二维码按最近邻缩放，保持模块边缘清晰
+        qr = qrcode_image(tree_db_id).convert('L').resize((qr_size, qr_size), Image.NEAREST)
+        page.paste(qr, (x0 + (cell_w - qr_size) // 2, y0))
+
+        text = str(tree_id or tree_db_id)
+        text_w = draw.textlength(text, font=font)
+        draw.text((x0 + (cell_w - text_w) / 2, y0 + qr_size + text_h // 4), text, fill=0, font=font)
+
+        # 裁切辅助线
+        draw.rectangle([x0, y0, x0 + cell_w - 1, y0 + cell_h - 1], outline=200)
+
+    return width, height, zlib.compress(page.tobytes(), 6)
+
+
+def render_label_pngs(labels: List[Tuple[int, str]]) -> List[Tuple[str, bytes]]:
+    """
+    生成一组二维码 PNG（进程池任务）
+    @param labels: [(id, tree_id), ...]
+    @return: [(文件名, PNG 字节), ...]
+    """
+    return [
+        (f"{tree_id or 'tree'}_{tree_db_id}.png", base64.b64decode(generate_qrcode_with_id(tree_db_id)))
+        for tree_db_id, tree_id in labels
+    ]
+
+
+def iter_rendered(render: Callable, chunks: Iterable, workers: int, *args) -> Iterator:
+    """
+    使用进程池并行渲染，按提交顺序逐个产出结果
+    同时在途的任务数不超过 workers * 2，内存占用与总数量无关
+    @param render: 渲染函数（模块级函数，可被子进程调用）
+    @param chunks: 待渲染的分组
+    @param workers: 进程数，不大于 1 时在当前进程渲染
+    @param args: 传给渲染函数的其他参数
+    @return: 生成器
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield render(chunk, *args)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(render, chunk, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # 客户端中途断开时取消尚未开始的任务
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class StreamingPdfWriter:
+    """
+    逐页输出的 PDF 写入器：每页为一张 Flate 压缩的灰度图片
+    页面对象写出后即可发送，只在内存中保留对象偏移量，最后输出页面树和交叉引用表
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, dpi: int):
+        """
+        初始化写入器
+        @param dpi: 页面图片分辨率，用于换算页面尺寸（pt）
+        """
+        self.dpi = dpi
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def _object(self, obj_id: int, body: bytes, stream: Optional[bytes] = None) -> bytes:
+        self.offsets[obj_id] = self.offset
+        data = f"{obj_id} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        return self._emit(data + b"\nendobj\n")
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def page(self, width: int, height: int, pixels: bytes) -> bytes:
+        """
+        输出一页
+        @param width: 图片宽度（像素）
+        @param height: 图片高度（像素）
+        @param pixels: zlib 压缩的 8 位灰度像素数据
+        @return: 该页对应的 PDF 字节
+        """
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        self.page_ids.append(page_id)
+
+        page_w = width * 72.0 / self.dpi
+        page_h = height * 72.0 / self.dpi
+        content = f"q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Im0 Do Q".encode()
+
+        return b"".join([
+            self._object(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(pixels)} >>"
+            ).encode(), pixels),
+            self._object(content_id, f"<< /Length {len(content)} >>".encode(), content),
+            self._object(page_id, (
+                f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode())
+        ])
+
+    def trailer(self) -> bytes:
+        """输出页面树、目录、交叉引用表和文件尾"""
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        data = self._object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        data += self._object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>".encode())
+
+        xref_offset = self.offset
+        size = self.next_id
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            xref.append(f"{self.offsets[obj_id]:010d} 00000 n \n")
+        xref.append(f"trailer\n<< /Size {size} /Root {self.CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        return data + self._emit(''.join(xref).encode())
+
+
+def stream_label_pdf(trees: Iterable[Tuple[int, str]], layout: Dict, workers: int) -> Iterator[bytes]:
+    """
+    流式生成 A4 标签 PDF：各页在进程池中并行渲染，渲染完成即按顺序输出
+    @param trees: (id, tree_id) 可迭代对象
+    @param layout: 版式配置（columns, rows, dpi, margin_mm）
+    @param workers: 进程数
+    @return: PDF 字节块生成器
+    """
+    logger = logging.getLogger(__name__)
+    writer = StreamingPdfWriter(layout['dpi'])
+    yield writer.header()
+
+    pages = chunked(trees, layout['columns'] * layout['rows'])
+    for width, height, pixels in iter_rendered(render_label_page, pages, workers, layout):
+        yield writer.page(width, height, pixels)
+
+    if not writer.page_ids:
+        # 没有选中任何树木时输出一页空白页，保证 PDF 有效
+        yield writer.page(*render_label_page([], layout))
+
+    yield writer.trailer()
+    logger.info(f"Label PDF exported: {len(writer.page_ids)} pages")
+
+
+class _ZipStream(io.RawIOBase):
+    """zipfile 的输出缓冲：不可 seek，写入的数据由生成器取走后立即发送"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_label_zip(trees: Iterable[Tuple[int, str]], chunk_size: int, workers: int) -> Iterator[bytes]:
+    """
+    流式生成二维码 PNG 压缩包（PNG 已压缩，使用 ZIP_STORED）
+    @param trees: (id, tree_id) 可迭代对象
+    @param chunk_size: 每个进程任务包含的二维码数
+    @param workers: 进程数
+    @return: ZIP 字节块生成器
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for pngs in iter_rendered(render_label_pngs, chunked(trees, chunk_size), workers):
+            for name, data in pngs:
+                archive.writestr(name, data)
+            yield stream.drain()
+    yield stream.drain()
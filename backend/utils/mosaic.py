@@ -0,0 +1,110 @@
+# backend/utils/mosaic.py
+
+import math
+import os
+import xml.etree.ElementTree as ET
+import rasterio
+from typing import List
+from utils.run_manifest import fingerprint
+
+# rasterio 数据类型 -> GDAL VRT 数据类型
+GDAL_DATA_TYPES = {
+    'uint8': 'Byte',
+    'int8': 'Int8',
+    'uint16': 'UInt16',
+    'int16': 'Int16',
+    'uint32': 'UInt32',
+    'int32': 'Int32',
+    'float32': 'Float32',
+    'float64': 'Float64'
+}
+
+
+def strips_run_id(paths: List[str]) -> str:
+    """
+    根据输入条带（路径、大小、修改时间）计算运行编号，上传的数据变化时编号随之变化
+    @param paths: 输入文件路径列表
+    @return: 10 位十六进制运行编号
+    """
+    parts = []
+    for path in sorted(os.path.abspath(p) for p in paths):
+        stat = os.stat(path)
+        parts.extend([path, stat.st_size, stat.st_mtime_ns])
+    return fingerprint(*parts)[:10]
+
+
+def build_mosaic_vrt(paths: List[str], vrt_path: str) -> str:
+    """
+    生成覆盖所有条带并集范围的虚拟镶嵌（GDAL VRT），不把镶嵌结果写到磁盘
+    各条带须使用相同坐标系和数据类型，分辨率取最精细的条带；重叠区域后面的条带覆盖前面的条带，
+    条带的无效值区域保持透明
+    @param paths: 条带文件路径列表
+    @param vrt_path: 输出 VRT 文件路径（已存在时直接返回）
+    @return: VRT 文件路径
+    """
+    if os.path.exists(vrt_path):
+        return vrt_path
+
+    strips = []
+    for path in sorted(paths):
+        with rasterio.open(path) as src:
+            if src.transform.b != 0 or src.transform.d != 0:
+                raise ValueError(f"Rotated rasters are not supported in mosaic mode: {path}")
+            strips.append({
+                'path': os.path.abspath(path),
+                'crs': src.crs,
+                'dtype': src.dtypes[0],
+                'count': src.count,
+                'nodata': src.nodata,
+                'bounds': src.bounds,
+                'res': src.res,
+                'width': src.width,
+                'height': src.height
+            })
+
+    first = strips[0]
+    for strip in strips[1:]:
+        if strip['crs'] != first['crs']:
+            raise ValueError(f"Mosaic strips must share one CRS: {strip['path']}")
+        if strip['dtype'] != first['dtype']:
+            raise ValueError(f"Mosaic strips must share one data type: {strip['path']}")
+
+    res_x = min(strip['res'][0] for strip in strips)
+    res_y = min(strip['res'][1] for strip in strips)
+    left = min(strip['bounds'].left for strip in strips)
+    top = max(strip['bounds'].top for strip in strips)
+    right = max(strip['bounds'].right for strip in strips)
+    bottom = min(strip['bounds'].bottom for strip in strips)
+    width = int(math.ceil(round((right - left) / res_x, 6)))
+    height = int(math.ceil(round((top - bottom) / res_y, 6)))
+    count = min(strip['count'] for strip in strips)
+
+    root = ET.Element('VRTDataset', rasterXSize=str(width), rasterYSize=str(height))
+    if first['crs']:
+        ET.SubElement(root, 'SRS').text = first['crs'].to_wkt()
+    ET.SubElement(root, 'GeoTransform').text = f"{left!r}, {res_x!r}, 0.0, {top!r}, 0.0, {-res_y!r}"
+
+    for band in range(1, count + 1):
+        band_el = ET.SubElement(root, 'VRTRasterBand', dataType=GDAL_DATA_TYPES[first['dtype']], band=str(band))
+        if first['nodata'] is not None:
+            ET.SubElement(band_el, 'NoDataValue').text = repr(first['nodata'])
+
+        for strip in strips:
+            source = ET.SubElement(band_el, 'ComplexSource')
+            ET.SubElement(source, 'SourceFilename', relativeToVRT='0').text = strip['path']
+            ET.SubElement(source, 'SourceBand').text = str(band)
+            ET.SubElement(source, 'SrcRect', xOff='0', yOff='0',
+                          xSize=str(strip['width']), ySize=str(strip['height']))
+            ET.SubElement(source, 'DstRect',
+                          xOff=repr((strip['bounds'].left - left) / res_x),
+                          yOff=repr((top - strip['bounds'].top) / res_y),
+                          xSize=repr(strip['width'] * strip['res'][0] / res_x),
+                          ySize=repr(strip['height'] * strip['res'][1] / res_y))
+            if strip['nodata'] is not None:
+                ET.SubElement(source, 'NODATA').text = repr(strip['nodata'])
+
+    os.makedirs(os.path.dirname(os.path.abspath(vrt_path)), exist_ok=True)
+    tmp_path = f"{vrt_path}.{os.getpid()}.tmp"
+    ET.ElementTree(root).write(tmp_path, encoding='utf-8')
+    os.replace(tmp_path, vrt_path)
+    return vrt_path
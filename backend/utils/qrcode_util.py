@@ -1,19 +1,29 @@
 import qrcode
 import base64
+import hashlib
+import os
+import threading
+import time
 from io import BytesIO
-import mysql.connector
+from concurrent.futures import ProcessPoolExecutor
+import sys
 
-# 数据库配置
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': '123456',
-    'database': '橡胶树信息'
-}
+if __package__ in (None, ''):
+    # 作为脚本直接运行（python utils/qrcode_util.py）时，将 backend 目录加入导入路径
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CONFIG
+from utils.db_pool import close_streaming_cursor, get_connection
+
+# 数据库配置（与 app.py 共用同一个连接池）
+DB_CONFIG = CONFIG['database']
+
+# 二维码存储配置
+QRCODE_CONFIG = CONFIG['qrcode']
 
 def get_db_connection():
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = get_connection(DB_CONFIG, CONFIG['database_pool'])
         print("✅ 数据库连接成功")
         return connection
     except Exception as e:
@@ -30,8 +40,9 @@ def ensure_qrcode_column_exists(cursor, table_name='tree_data'):
     else:
         print("✅ 'qrcode' 字段已存在")
 
-def generate_qrcode_with_id(tree_id):
-    frontend_url = f"http://localhost:8080/tree/{tree_id}"
+def generate_qrcode_png(tree_id, url_template=None):
+    """生成跳转二维码的 PNG 字节"""
+    frontend_url = (url_template or QRCODE_CONFIG['url_template']).format(tree_id=tree_id)
     qr = qrcode.QRCode(
         version=None,
         error_correction=qrcode.constants.ERROR_CORRECT_M,
@@ -43,7 +54,99 @@ def generate_qrcode_with_id(tree_id):
     img = qr.make_image(fill_color="#2c3e50", back_color="#ffffff")
     buffered = BytesIO()
     img.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+    return buffered.getvalue()
+
+def generate_qrcode_with_id(tree_id):
+    return base64.b64encode(generate_qrcode_png(tree_id)).decode()
+
+def qrcode_key(tree_id, url_template=None):
+    """二维码内容地址：由树木 id 和 URL 模板（即二维码内容）计算，模板变化时自动生成新文件"""
+    url_template = url_template or QRCODE_CONFIG['url_template']
+    return hashlib.sha256(f"{url_template}|{tree_id}".encode('utf-8')).hexdigest()
+
+def qrcode_store_path(tree_id, url_template=None):
+    """二维码文件路径：<store_dir>/<key 前两位>/<key>.png"""
+    key = qrcode_key(tree_id, url_template)
+    return os.path.join(QRCODE_CONFIG['store_dir'], key[:2], f"{key}.png")
+
+def save_qrcode_file(tree_id, url_template=None):
+    """生成二维码并写入存储（先写临时文件再原子替换），返回文件路径"""
+    path = qrcode_store_path(tree_id, url_template)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 临时文件名带进程号和线程号，多个请求线程同时生成同一二维码时互不冲突
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(generate_qrcode_png(tree_id, url_template))
+    os.replace(tmp_path, path)
+    return path
+
+def tree_exists(tree_id):
+    """检查 tree_data 中是否存在该 id 的树木"""
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError("数据库连接失败")
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM tree_data WHERE id = %s", (tree_id,))
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+        connection.close()
+
+def _save_qrcode_file_task(args):
+    """进程池任务"""
+    tree_id, url_template = args
+    save_qrcode_file(tree_id, url_template)
+    return tree_id
+
+def generate_qrcode_store(tree_ids=None, url_template=None, workers=None, progress_callback=None):
+    """
+    批量生成二维码文件：已存在的跳过，缺失的用进程池并行生成
+    @param tree_ids: 树木 id 列表，为 None 时处理 tree_data 中的全部记录
+    @param url_template: URL 模板，默认使用配置
+    @param workers: 进程数，默认使用配置
+    @param progress_callback: 进度回调，参数为本次完成的数量
+    @return: {'generated': 新生成数量, 'skipped': 已存在数量, 'seconds': 耗时}
+    """
+    start_time = time.perf_counter()
+    url_template = url_template or QRCODE_CONFIG['url_template']
+    workers = workers or QRCODE_CONFIG['workers']
+
+    if tree_ids is None:
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("数据库连接失败")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id FROM tree_data")
+            tree_ids = [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+            conn.close()
+
+    missing = [tree_id for tree_id in tree_ids if not os.path.exists(qrcode_store_path(tree_id, url_template))]
+    print(f"📦 共 {len(tree_ids)} 条记录，{len(missing)} 条需要生成二维码。")
+
+    if missing:
+        tasks = [(tree_id, url_template) for tree_id in missing]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for _ in executor.map(_save_qrcode_file_task, tasks, chunksize=QRCODE_CONFIG['chunk_size']):
+                    if progress_callback:
+                        progress_callback(1)
+        else:
+            for task in tasks:
+                _save_qrcode_file_task(task)
+                if progress_callback:
+                    progress_callback(1)
+
+    stats = {
+        'generated': len(missing),
+        'skipped': len(tree_ids) - len(missing),
+        'seconds': time.perf_counter() - start_time
+    }
+    print(f"✅ 二维码生成完成：新生成 {stats['generated']}，跳过 {stats['skipped']}，耗时 {stats['seconds']:.2f}s")
+    return stats
 
 def generate_qrcode_base64(data_dict):
     def safe(v):
@@ -132,5 +235,79 @@ def generate_and_save_qrcodes():
             conn.close()
         print("🔚 数据库连接已关闭")
 
+def regenerate_qrcodes_chunked(chunk_size=None, workers=None, progress_callback=None):
+    """
+    分块生成缺失的二维码并写回 tree_data.qrcode
+    非缓冲游标逐块读取待处理记录，每块并行生成后用 executemany 批量更新并提交，
+    内存占用只与块大小有关，中途出错最多丢失当前一块
+    @param chunk_size: 每块记录数，默认使用配置
+    @param workers: 进程数，默认使用配置
+    @param progress_callback: 进度回调，参数为本次完成的数量
+    @return: {'updated': 更新数量, 'seconds': 耗时}
+    """
+    chunk_size = chunk_size or QRCODE_CONFIG['db_chunk_size']
+    workers = workers or QRCODE_CONFIG['workers']
+    start_time = time.perf_counter()
+    updated = 0
+
+    # 读写分别使用两个连接：非缓冲游标未读完前，同一连接不能执行其他语句
+    reader_conn = get_db_connection()
+    writer_conn = get_db_connection()
+    if not reader_conn or not writer_conn:
+        for conn in (reader_conn, writer_conn):
+            if conn:
+                conn.close()
+        raise RuntimeError("数据库连接失败")
+
+    reader = None
+    writer = writer_conn.cursor()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        ensure_qrcode_column_exists(writer)
+        writer_conn.commit()
+
+        reader = reader_conn.cursor(buffered=False)
+        reader.execute("SELECT id FROM tree_data WHERE qrcode IS NULL OR qrcode = '' ORDER BY id")
+
+        while True:
+            rows = reader.fetchmany(chunk_size)
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+
+            if executor:
+                codes = list(executor.map(generate_qrcode_with_id, ids,
+                                          chunksize=max(1, len(ids) // (workers * 4))))
+            else:
+                codes = [generate_qrcode_with_id(id_) for id_ in ids]
+
+            writer.executemany("UPDATE tree_data SET qrcode = %s WHERE id = %s", list(zip(codes, ids)))
+            writer_conn.commit()  # 每块提交一次
+
+            updated += len(ids)
+            if progress_callback:
+                progress_callback(len(ids))
+            print(f"📦 已更新 {updated} 条二维码（{updated / (time.perf_counter() - start_time):.0f} 条/秒）")
+
+        print("✅ 二维码分块生成并保存成功。")
+        return {'updated': updated, 'seconds': time.perf_counter() - start_time}
+
+    except Exception as e:
+        print(f"❌ 处理过程中出错: {str(e)}")
+        writer_conn.rollback()
+        raise
+    finally:
+        if executor:
+            executor.shutdown()
+        try:
+            try:
+                writer.close()
+            finally:
+                writer_conn.close()
+        finally:
+            # 出错时读取游标可能未读完，先丢弃剩余结果再归还连接
+            close_streaming_cursor(reader, reader_conn, chunk_size)
+        print("🔚 数据库连接已关闭")
+
 if __name__ == "__main__":
     generate_and_save_qrcodes()
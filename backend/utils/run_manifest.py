@@ -0,0 +1,226 @@
+# backend/utils/run_manifest.py
+
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS input_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tiles (
+    stage TEXT NOT NULL,
+    tile_key TEXT NOT NULL,
+    source TEXT NOT NULL,
+    col_off INTEGER NOT NULL,
+    row_off INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    PRIMARY KEY (stage, tile_key)
+);
+CREATE TABLE IF NOT EXISTS stage_status (
+    stage TEXT NOT NULL,
+    tile_key TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    model_hash TEXT,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (stage, tile_key)
+);
+"""
+
+
+def fingerprint(*parts) -> str:
+    """
+    计算输入指纹：各部分转为字符串后拼接求 sha256
+    @param parts: 参与计算的值（上游指纹、窗口、处理参数等）
+    @return: 十六进制指纹
+    """
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class RunManifest:
+    """
+    运行清单（SQLite）：记录每个切片的窗口、输入指纹、模型指纹及各阶段状态
+    各阶段只处理输入发生变化或尚未完成的切片，崩溃后重新执行即可从断点继续
+    """
+
+    def __init__(self, path: str):
+        """
+        打开（不存在时创建）运行清单
+        @param path: SQLite 文件路径
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 阶段处理器可能在读取线程中访问，连接由锁保护
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def close(self):
+        """关闭清单"""
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def file_hash(self, path: str) -> str:
+        """
+        计算文件内容的 sha256，按 (大小, 修改时间) 缓存，文件未变化时不重复读取
+        @param path: 文件路径
+        @return: 十六进制哈希
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sha256 FROM input_files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        start_time = time.perf_counter()
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO input_files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, sha256)
+            )
+        self.logger.info(f"Hashed {path} in {time.perf_counter() - start_time:.2f}s")
+        return sha256
+
+    def record_tiles(self, stage: str, source: str, tiles: Iterable[Tuple]):
+        """
+        记录切片窗口
+        @param stage: 阶段名称
+        @param source: 源文件路径
+        @param tiles: [(切片键, col_off, row_off, width, height), ...]
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tiles (stage, tile_key, source, col_off, row_off, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(stage, key, source, *window) for key, *window in tiles]
+            )
+
+    def stage_hashes(self, stage: str) -> Dict[str, str]:
+        """
+        获取某阶段已完成切片的输入指纹，供下游阶段计算自己的指纹
+        @param stage: 阶段名称
+        @return: {切片键: 输入指纹}
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT tile_key, input_hash FROM stage_status WHERE stage = ? AND status = 'done'", (stage,)
+            ).fetchall()
+        return dict(rows)
+
+    def pending(self, stage: str, inputs: Dict[str, str]) -> List[str]:
+        """
+        找出需要处理的切片：从未完成，或记录的输入指纹与当前不同
+        @param stage: 阶段名称
+        @param inputs: {切片键: 当前输入指纹}
+        @return: 需要处理的切片键列表
+        """
+        done = self.stage_hashes(stage)
+        return [key for key, input_hash in inputs.items() if done.get(key) != input_hash]
+
+    def mark_done(self, stage: str, items: Iterable[Tuple[str, str]], model_hash: Optional[str] = None):
+        """
+        记录一批切片在某阶段已完成（单个事务提交）
+        @param stage: 阶段名称
+        @param items: [(切片键, 输入指纹), ...]
+        @param model_hash: 模型权重指纹（检测阶段）
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO stage_status (stage, tile_key, input_hash, model_hash, status, updated_at) "
+                "VALUES (?, ?, ?, ?, 'done', ?)",
+                [(stage, key, input_hash, model_hash, now) for key, input_hash in items]
+            )
+
+    def forget(self, stage: str, keys: Iterable[str]):
+        """
+        删除切片在某阶段的完成记录（输出文件被删除时调用，下次运行重新处理）
+        @param stage: 阶段名称
+        @param keys: 切片键列表
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM stage_status WHERE stage = ? AND tile_key = ?", [(stage, key) for key in keys]
+            )
+
+    def recorder(self, stage: str, flush_every: int = 64, model_hash: Optional[str] = None) -> 'StageRecorder':
+        """
+        创建阶段完成记录器，按批写入清单
+        @param stage: 阶段名称
+        @param flush_every: 每累计多少个切片提交一次
+        @param model_hash: 模型权重指纹
+        @return: StageRecorder
+        """
+        return StageRecorder(self, stage, flush_every, model_hash)
+
+
+class StageRecorder:
+    """
+    阶段完成记录器：累计已完成的切片并分批提交，退出时提交剩余部分（出错时也会保留已完成的切片）
+    """
+
+    def __init__(self, manifest: RunManifest, stage: str, flush_every: int = 64, model_hash: Optional[str] = None):
+        self.manifest = manifest
+        self.stage = stage
+        self.flush_every = flush_every
+        self.model_hash = model_hash
+        self.items = []
+
+    def add(self, key: str, input_hash: str):
+        """记录一个已完成的切片"""
+        self.items.append((key, input_hash))
+        if len(self.items) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """提交累计的记录"""
+        if self.items:
+            self.manifest.mark_done(self.stage, self.items, self.model_hash)
+            self.items = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def open_run_manifest(output_dir: str, manifest_config: Dict):
+    """
+    按配置打开输出目录下的运行清单
+    @param output_dir: 输出目录
+    @param manifest_config: 清单配置（enabled, filename）
+    @return: 上下文管理器，进入后得到 RunManifest，未启用时得到 None
+    """
+    if not manifest_config.get('enabled', True):
+        return contextlib.nullcontext()
+    return RunManifest(os.path.join(output_dir, manifest_config.get('filename', 'manifest.sqlite')))
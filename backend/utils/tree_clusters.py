@@ -0,0 +1,139 @@
+# backend/utils/tree_clusters.py
+
+import math
+import threading
+import logging
+import numpy as np
+from typing import Callable, Dict, List
+from utils.db_pool import close_streaming_cursor
+
+
+MAX_LATITUDE = 85.05112878  # Web Mercator 纬度范围
+
+
+def lonlat_to_mercator(lon: np.ndarray, lat: np.ndarray):
+    """
+    经纬度转换为归一化的 Web Mercator 坐标（0~1，原点在左上角）
+    @param lon: 经度数组
+    @param lat: 纬度数组
+    @return: (x, y) 数组
+    """
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+class TreeClusterIndex:
+    """
+    树木聚合索引：按缩放级别将树木划分到网格单元，统计每个单元的数量和中心点
+    每个缩放级别首次查询时计算并缓存，save_coordinates 导入新数据后调用 invalidate() 清空
+    """
+
+    def __init__(self, load_points: Callable, cells_per_tile: int = 16, max_zoom: int = 22):
+        """
+        初始化聚合索引
+        @param load_points: 加载全部树木坐标的函数，返回 (经度数组, 纬度数组)
+        @param cells_per_tile: 每个瓦片在每个方向上划分的网格数
+        @param max_zoom: 支持的最大缩放级别
+        """
+        self.load_points = load_points
+        self.cells_per_tile = cells_per_tile
+        self.max_zoom = max_zoom
+        self._points = None  # (mercator_x, mercator_y, lon, lat)
+        self._levels = {}  # zoom -> (瓦片键, 数量, 经度和, 纬度和)，按瓦片键排序
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def invalidate(self):
+        """清空缓存，下次查询时重新从数据库加载"""
+        with self._lock:
+            self._points = None
+            self._levels = {}
+        self.logger.info("Tree cluster cache invalidated")
+
+    def _ensure_points(self):
+        """加载树木坐标（需持有锁）"""
+        if self._points is None:
+            lon, lat = self.load_points()
+            lon = np.asarray(lon, dtype=np.float64)
+            lat = np.asarray(lat, dtype=np.float64)
+            mx, my = lonlat_to_mercator(lon, lat)
+            self._points = (mx, my, lon, lat)
+            self.logger.info(f"Loaded {len(lon)} trees for clustering")
+        return self._points
+
+    def _build_level(self, z: int):
+        """
+        计算某一缩放级别的网格聚合（需持有锁）
+        @param z: 缩放级别
+        """
+        mx, my, lon, lat = self._ensure_points()
+        n_cells = (1 << z) * self.cells_per_tile
+        cell_x = (mx * n_cells).astype(np.int64)
+        cell_y = (my * n_cells).astype(np.int64)
+
+        # 单元键按 (瓦片键, 单元) 排序，便于按瓦片二分查找
+        tile_key = (cell_x // self.cells_per_tile) * (1 << z) + cell_y // self.cells_per_tile
+        cell_key = tile_key * self.cells_per_tile ** 2 + \
+            (cell_x % self.cells_per_tile) * self.cells_per_tile + cell_y % self.cells_per_tile
+
+        keys, inverse, counts = np.unique(cell_key, return_inverse=True, return_counts=True)
+        sum_lon = np.bincount(inverse, weights=lon, minlength=len(keys))
+        sum_lat = np.bincount(inverse, weights=lat, minlength=len(keys))
+        self._levels[z] = (keys // self.cells_per_tile ** 2, counts, sum_lon, sum_lat)
+
+    def clusters(self, z: int, x: int, y: int) -> List[Dict]:
+        """
+        获取一个 Web Mercator 瓦片内的聚合结果
+        @param z: 缩放级别
+        @param x: 瓦片列号
+        @param y: 瓦片行号
+        @return: [{'count': 数量, 'longitude': 中心经度, 'latitude': 中心纬度}, ...]
+        """
+        if not 0 <= z <= self.max_zoom or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            raise ValueError(f"Invalid tile: {z}/{x}/{y}")
+
+        with self._lock:
+            if z not in self._levels:
+                self._build_level(z)
+            tile_keys, counts, sum_lon, sum_lat = self._levels[z]
+
+        key = x * (1 << z) + y
+        start, end = np.searchsorted(tile_keys, [key, key + 1])
+        return [
+            {
+                'count': int(counts[k]),
+                'longitude': float(sum_lon[k] / counts[k]),
+                'latitude': float(sum_lat[k] / counts[k])
+            }
+            for k in range(start, end)
+        ]
+
+
+def load_tree_points(get_connection: Callable, batch_size: int = 10000):
+    """
+    从 tree_data 读取全部树木坐标（非缓冲游标分批读取）
+    @param get_connection: 获取数据库连接的函数
+    @param batch_size: 每次读取的行数
+    @return: (经度数组, 纬度数组)
+    """
+    connection = get_connection()
+    cursor = connection.cursor(buffered=False)
+    lon_chunks, lat_chunks = [], []
+    try:
+        cursor.execute("SELECT longitude, latitude FROM tree_data")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            chunk = np.asarray(rows, dtype=np.float64)
+            lon_chunks.append(chunk[:, 0])
+            lat_chunks.append(chunk[:, 1])
+    finally:
+        # 读取中途出错时结果集可能未读完，先丢弃剩余结果再归还连接
+        close_streaming_cursor(cursor, connection, batch_size)
+
+    if not lon_chunks:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(lon_chunks), np.concatenate(lat_chunks)
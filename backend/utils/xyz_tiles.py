@@ -0,0 +1,286 @@
+# backend/utils/xyz_tiles.py
+
+import io
+import math
+import os
+import shutil
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from affine import Affine
+from PIL import Image
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.transform import from_bounds
+from rasterio.warp import reproject, transform_bounds
+from rasterio.windows import Window
+from rasterio.windows import from_bounds as window_from_bounds
+from typing import Dict, List, Optional
+from utils.run_manifest import fingerprint
+
+# Web Mercator（EPSG:3857）全球范围的一半（米）
+MERCATOR_HALF = math.pi * 6378137.0
+
+
+def mercator_tile_bounds(z: int, x: int, y: int):
+    """
+    计算 XYZ 瓦片在 EPSG:3857 下的范围
+    @param z: 缩放级别
+    @param x: 瓦片列号
+    @param y: 瓦片行号（原点在左上角）
+    @return: (left, bottom, right, top)
+    """
+    span = 2 * MERCATOR_HALF / (1 << z)
+    left = -MERCATOR_HALF + x * span
+    top = MERCATOR_HALF - y * span
+    return left, top - span, left + span, top
+
+
+def render_tile(src, z: int, x: int, y: int, tile_size: int = 256, resampling: str = 'bilinear') -> Optional[bytes]:
+    """
+    渲染一张 Web Mercator 瓦片（RGBA PNG）
+    只读取覆盖瓦片范围的窗口，并按瓦片分辨率降采样读取（GDAL 自动选用最接近的概览层级），
+    再在内存中重投影到瓦片网格
+    @param src: 已打开的DOM数据集
+    @param z: 缩放级别
+    @param x: 瓦片列号
+    @param y: 瓦片行号
+    @param tile_size: 瓦片像素大小
+    @param resampling: 重投影的重采样方法
+    @return: PNG 字节，瓦片与DOM不相交时返回 None
+    """
+    if not src.crs:
+        return None
+    left, bottom, right, top = mercator_tile_bounds(z, x, y)
+    src_bounds = transform_bounds('EPSG:3857', src.crs, left, bottom, right, top, densify_pts=21)
+    try:
+        window = window_from_bounds(*src_bounds, transform=src.transform).intersection(
+            Window(0, 0, src.width, src.height))
+    except WindowError:
+        return None
+
+    # 取整到像素边界
+    col_off, row_off = math.floor(window.col_off), math.floor(window.row_off)
+    width = math.ceil(window.col_off + window.width) - col_off
+    height = math.ceil(window.row_off + window.height) - row_off
+    if width <= 0 or height <= 0:
+        return None
+    window = Window(col_off, row_off, width, height)
+
+    # 读取分辨率约为瓦片的两倍（重投影时有足够的采样），不超过原始分辨率
+    scale = max(1.0, max(width, height) / (tile_size * 2))
+    out_width = max(1, int(round(width / scale)))
+    out_height = max(1, int(round(height / scale)))
+    indexes = [1, 2, 3] if src.count >= 3 else [1]
+    data = src.read(indexes, window=window, out_shape=(len(indexes), out_height, out_width),
+                    resampling=Resampling.average)
+    mask = src.dataset_mask(window=window, out_shape=(out_height, out_width))
+    src_transform = src.window_transform(window) * Affine.scale(width / out_width, height / out_height)
+
+    dst_transform = from_bounds(left, bottom, right, top, tile_size, tile_size)
+    rgb = np.zeros((len(indexes), tile_size, tile_size), dtype=data.dtype)
+    alpha = np.zeros((tile_size, tile_size), dtype=np.uint8)
+    reproject(data, rgb, src_transform=src_transform, src_crs=src.crs,
+              dst_transform=dst_transform, dst_crs='EPSG:3857', resampling=Resampling[resampling])
+    reproject(mask, alpha, src_transform=src_transform, src_crs=src.crs,
+              dst_transform=dst_transform, dst_crs='EPSG:3857', resampling=Resampling.nearest)
+
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+    if len(indexes) == 1:
+        rgb = np.repeat(rgb, 3, axis=0)
+    image = Image.fromarray(np.dstack([rgb[0], rgb[1], rgb[2], alpha]), 'RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def empty_tile(tile_size: int = 256) -> bytes:
+    """
+    生成透明瓦片
+    @param tile_size: 瓦片像素大小
+    @return: PNG 字节
+    """
+    buffer = io.BytesIO()
+    Image.new('RGBA', (tile_size, tile_size)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TileCache:
+    """
+    进程内 LRU 瓦片缓存，按字节数限制容量
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        初始化
+        @param max_bytes: 缓存的最大字节数
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[bytes]:
+        """获取瓦片并标记为最近使用"""
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes):
+        """放入瓦片，超出容量时淘汰最久未使用的瓦片"""
+        with self._lock:
+            if key in self._items:
+                self.size -= len(self._items.pop(key))
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+class XyzTileServer:
+    """
+    DOM 正射影像 XYZ 瓦片服务：按需渲染 Web Mercator 瓦片，进程内 LRU 缓存 + 磁盘缓存
+    磁盘缓存按DOM文件（路径、大小、修改时间）分版本，重新上传后旧版本瓦片自动清理
+    """
+
+    def __init__(self, config: Dict):
+        """
+        初始化
+        @param config: 配置信息字典（input_dir, output_dir, xyz_tiles）
+        """
+        self.config = config
+        self.tile_config = config.get('xyz_tiles', {})
+        self.tile_size = self.tile_config.get('tile_size', 256)
+        self.max_zoom = self.tile_config.get('max_zoom', 24)
+        self.dom_input_dir = os.path.join(config['input_dir'], 'dom')
+        self.mosaic_dir = os.path.join(config['output_dir'], 'mosaic')
+        self.cache_dir = os.path.join(config['output_dir'], 'xyz_tiles')
+        self.memory_cache = TileCache(self.tile_config.get('memory_cache_mb', 256) * 1024 * 1024)
+        self._empty_tile = None
+        self._versions = {}  # run -> 版本，版本未变化时不再检查旧版本目录
+        self._lock = threading.Lock()
+
+        # 设置日志
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+
+    def resolve_run(self, run: str) -> Optional[str]:
+        """
+        将运行名称解析为DOM栅格：input/dom 下的同名 COG，或镶嵌模式的运行编号（output/mosaic/dom_<run>.vrt）
+        @param run: 运行名称
+        @return: 栅格路径，不存在时返回 None
+        """
+        if not run or os.path.basename(run) != run or run.startswith('.'):
+            return None
+        for path in (os.path.join(self.dom_input_dir, f'{run}.tif'),
+                     os.path.join(self.mosaic_dir, f'dom_{run}.vrt')):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def list_runs(self) -> List[Dict]:
+        """
+        列出可用的瓦片数据源及其经纬度范围、缩放级别范围
+        @return: [{'run', 'bounds', 'minzoom', 'maxzoom'}, ...]
+        """
+        paths = []
+        if os.path.isdir(self.dom_input_dir):
+            paths += [(os.path.splitext(f)[0], os.path.join(self.dom_input_dir, f))
+                      for f in sorted(os.listdir(self.dom_input_dir)) if f.endswith('.tif')]
+        if os.path.isdir(self.mosaic_dir):
+            paths += [(f[len('dom_'):-len('.vrt')], os.path.join(self.mosaic_dir, f))
+                      for f in sorted(os.listdir(self.mosaic_dir)) if f.startswith('dom_') and f.endswith('.vrt')]
+
+        runs = []
+        for run, path in paths:
+            with rasterio.open(path) as src:
+                if not src.crs:
+                    continue
+                left, bottom, right, top = transform_bounds(src.crs, 'EPSG:3857', *src.bounds, densify_pts=21)
+                resolution = (right - left) / src.width
+                runs.append({
+                    'run': run,
+                    'bounds': list(transform_bounds(src.crs, 'EPSG:4326', *src.bounds, densify_pts=21)),
+                    'minzoom': 0,
+                    'maxzoom': min(self.max_zoom, max(0, math.ceil(
+                        math.log2(2 * MERCATOR_HALF / (self.tile_size * resolution)))))
+                })
+        return runs
+
+    def version(self, run: str, path: str) -> str:
+        """
+        计算DOM版本；版本变化时清理该运行的旧版本磁盘缓存
+        @param run: 运行名称
+        @param path: DOM路径
+        @return: 版本（10 位十六进制）
+        """
+        stat = os.stat(path)
+        version = fingerprint(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)[:10]
+        with self._lock:
+            if self._versions.get(run) == version:
+                return version
+            self._versions[run] = version
+
+        run_dir = os.path.join(self.cache_dir, run)
+        if os.path.isdir(run_dir):
+            for name in os.listdir(run_dir):
+                if name != version:
+                    shutil.rmtree(os.path.join(run_dir, name), ignore_errors=True)
+                    self.logger.info(f"Removed stale tile cache {run}/{name}")
+        return version
+
+    def get_tile(self, run: str, z: int, x: int, y: int):
+        """
+        获取瓦片：依次查找进程内缓存、磁盘缓存，都未命中时渲染并写入两级缓存
+        @param run: 运行名称
+        @param z: 缩放级别
+        @param x: 瓦片列号
+        @param y: 瓦片行号
+        @return: (PNG 字节, ETag)，运行不存在时返回 None
+        @raise ValueError: 瓦片坐标超出范围
+        """
+        if not 0 <= z <= self.max_zoom or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            raise ValueError(f"Invalid tile {z}/{x}/{y}")
+        path = self.resolve_run(run)
+        if path is None:
+            return None
+
+        version = self.version(run, path)
+        key = (run, version, z, x, y)
+        etag = f'{run}-{version}-{z}-{x}-{y}'
+        data = self.memory_cache.get(key)
+        if data is not None:
+            return data, etag
+
+        cache_path = os.path.join(self.cache_dir, run, version, str(z), str(x), f'{y}.png')
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+        else:
+            with rasterio.open(path) as src:
+                data = render_tile(src, z, x, y, self.tile_size, self.tile_config.get('resampling', 'bilinear'))
+            if data is None:
+                if self._empty_tile is None:
+                    self._empty_tile = empty_tile(self.tile_size)
+                data = self._empty_tile
+            elif self.tile_config.get('disk_cache', True):
+                # 写临时文件后替换，并发请求同一瓦片时不会读到写了一半的文件
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, cache_path)
+
+        self.memory_cache.put(key, data)
+        return data, etag
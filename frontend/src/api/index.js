@@ -13,4 +13,52 @@ export const getCoordinates = async () => {
 export const addCoordinate = async (coordinate) => {
     const response = await axios.post(`${API_URL}/coordinates`, coordinate);
     return response.data;
-};
\ No newline at end of file
+};
+// 按经纬度范围获取树木（地图只请求可视范围内的点）
+export const getTreesInBbox = async (minLon, minLat, maxLon, maxLat, limit) => {
+    const response = await axios.get(`${API_URL}/trees`, {
+        params: { bbox: [minLon, minLat, maxLon, maxLat].join(','), limit },
+    });
+    return response.data;
+};
+
+// 键集分页获取树木列表（NDJSON），afterId 为上一页最后一条记录的 id
+export const listTrees = async (afterId = 0, limit = 1000, fields) => {
+    const response = await axios.get(`${API_URL}/trees/list`, {
+        params: { after_id: afterId, limit, fields: fields ? fields.join(',') : undefined },
+        responseType: 'text',
+    });
+    return response.data.split('\n').filter((line) => line).map((line) => JSON.parse(line));
+};
+
+// 获取 Web Mercator 瓦片内的树木聚合结果
+export const getTreeClusters = async (z, x, y) => {
+    const response = await axios.get(`${API_URL}/trees/clusters`, { params: { z, x, y } });
+    return response.data;
+};
+
+// 树木二维码图片地址（可直接用于 <img :src>，由浏览器按 ETag 缓存）
+export const getQrcodeUrl = (id) => `${API_URL}/qrcode/${id}`;
+
+// 二维码标签导出地址（浏览器直接下载流式响应），format 为 'pdf' 或 'zip'
+// selection 可包含 bbox（[minlon, minlat, maxlon, maxlat]）、id_from、id_to、image_name
+export const getLabelExportUrl = (format = 'pdf', selection = {}) => {
+    const params = new URLSearchParams({ format });
+    Object.entries(selection).forEach(([key, value]) => {
+        if (value !== undefined && value !== null && value !== '') {
+            params.append(key, Array.isArray(value) ? value.join(',') : value);
+        }
+    });
+    return `${API_URL}/labels/export?${params.toString()}`;
+};
+
+// 正射影像瓦片数据源列表（运行名称、经纬度范围、缩放级别范围）
+export const getTileRuns = async () => {
+    const response = await axios.get(`${API_URL}/tiles`);
+    return response.data;
+};
+
+// 正射影像 XYZ 瓦片地址模板，可直接用作 Leaflet/OpenLayers 的瓦片图层地址
+export const getDomTileUrlTemplate = (run) => {
+    return `${API_URL}/tiles/${encodeURIComponent(run)}/{z}/{x}/{y}.png`;
+};